@@ -37,6 +37,8 @@ usage() {
                        [-m|--mem GB RAM] 
                        [-h|--hours MAX RUNTIME]
                        [-l|--local]
+                       [-p|--pack CORES]
+                       [--preview NAME]
 
 Snakefile wrapper/parser for metaGEM, for more details visit https://github.com/franciscozorrilla/metaGEM.
 
@@ -48,13 +50,17 @@ Options:
                             downloadToy
                             organizeData
                             check
+                            scratchReport
+                            previewReport
 
                         CORE WORKFLOW
                             fastp 
+                            previewReads
                             megahit 
                             crossMapSeries
                             kallistoIndex
                             crossMapParallel
+                            crossMapPartners
                             kallisto2concoct
                             concoct 
                             metabat
@@ -64,14 +70,18 @@ Options:
                             extractProteinBins
                             carveme
                             memote
+                            memoteBatch
                             organizeGEMs
                             smetana
+                            smetanaShard
                             extractDnaBins
                             gtdbtk
+                            gtdbtkBatch
                             abundance
 
                         BONUS
                             grid
+                            gridCohort
                             prokka
                             roary
                             eukrep
@@ -86,12 +96,19 @@ Options:
                             modelVis
                             interactionVis
                             growthVis
+                            timelineReport
+                            phaseReport
 
   -j, --nJobs       Specify number of jobs to run in parallel
   -c, --nCores      Specify number of cores per job
   -m, --mem         Specify memory in GB required for job
   -h, --hours       Specify number of hours to allocated to job runtime
   -l, --local       Run jobs on local machine for non-cluster usage
+  -p, --pack        Pack bin-level jobs (carveme, prokka, memote) into cluster jobs of CORES cores each,
+                    running CORES / task cores (config.yaml) jobs concurrently within each allocation
+  --preview         Run a core workflow task (megahit to binRefine) on the reads subsampled by the previewReads task,
+                    in the separate project root preview/NAME. Parameters set in ../config/preview/NAME.yaml
+                    override config.yaml for this run, compare runs with the previewReport task
 
 "
 }
@@ -192,58 +209,90 @@ run_stats() {
 
 echo -e "Checking status of current metaGEM analysis ... \n"
 
-#dataset: count subfolders to determine total number of samples
-nsamp=$(ls -d dataset/*/|wc -l)
-echo "Raw data: $nsamp samples were identified in the dataset folder ... "
+# Samples done per stage, checked against the outputs of each rule in a single parallel pass over the project folders.
+# Per sample progress: python scripts/runStatus.py --samples, JSON for dashboards: --json, refreshed every N seconds: --watch N
+python scripts/runStatus.py . --config config.yaml
+echo " "
 
-#qfilter: count .json report files
-nqfilt=$(find qfiltered -name "*.json"|wc -l)
-echo "Quality filtering: $nqfilt / $nsamp samples processed ... "
-    
-#assembly: count .gz fasta files
-nassm=$(find assemblies -name "*.gz"|wc -l)
-echo "Assembly: $nassm / $nsamp samples processed ... "
-    
-#concoct: count *concoct-bins subfolders
-nconc=$(find concoct -name "*.concoct-bins"|wc -l)
-echo "Binning (CONCOCT): $nconc / $nsamp samples processed ... "
-    
-#maxbin2: count *maxbin-bins subfolders
-nmaxb=$(find maxbin -name "*.maxbin-bins"|wc -l)
-echo "Binning (MaxBin2): $nmaxb / $nsamp samples processed ... "
-    
-#metabat2: count *metabat-bins subfolders
-nmetab=$(find metabat -name "*.metabat-bins"|wc -l)
-echo "Binning (MetaBAT2): $nmetab / $nsamp samples processed ... "
+}
 
-#metawrap_refine: count subfolders
-nmwref=$(ls -d refined_bins/*|wc -l)
-echo "Bin refinement: $nmwref / $nsamp samples processed ... "
-    
-#metawrap_reassemble: count subfolders, also determine total number of final MAGs across samples
-nmwrea=$(ls -d reassembled_bins/*|wc -l)
-echo "Bin reassembly: $nmwrea / $nsamp samples processed ... "
+# Run scratchReport task
+run_scratchReport() {
 
-#taxonomy: count subfolders
-ntax=$(ls -d GTDBTk/*|wc -l)
-echo "Taxonomy: $ntax / $nsamp samples processed ... "
-    
-#abundances: count subfolders
-nabund=$(ls -d abundance/*|wc -l)
-echo "Abundance: $nabund / $nsamp samples processed ... "
-    
-#models: count subfolders for sample progress and count .xml GEM files for total models generated
-ngems=$(find GEMs -name "*xml"|wc -l)
-ngemsamp=$(ls -d GEMs/*|wc -l)
-echo "GEMs: $ngems models generated from $ngemsamp samples ... "
-    
-#model reports: count subfolders
-nmemo=$(find memote -name "*.gz"|wc -l)
-echo "GEM Reports: $nmemo / $ngems models samples ... "
-    
-#simulations: count .tsv files
-nsmet=$(find memote -name "*.gz"|wc -l)
-echo -e "GEM Reports: $nsmet / $ngemsamp communities simulated ... \n"
+scratch=$(grep -m1 "^    scratch:" config.yaml|sed 's/^.*: //')
+echo -e "Checking job specific directories in scratch folder $scratch ... \n"
+
+# Lists each directory with its size and whether the job that created it is still running
+python scripts/scratch.py report $scratch
+
+echo -e "\nleaked directories belong to jobs that are no longer running, unmanaged directories were not created by metaGEM's scratch manager"
+while true; do
+    read -p "Do you wish to remove leaked and unmanaged directories? (y/n)" yn
+    case $yn in
+        [Yy]* ) python scripts/scratch.py report $scratch --clean leaked,unmanaged > /dev/null; break;;
+        [Nn]* ) break;;
+        * ) echo "Please answer yes or no.";;
+    esac
+done
+
+}
+
+# Run timelineReport task
+run_timelineReport() {
+
+echo -e "Breaking down the resource timelines of megahit, crossMapSeries, binRefine, binReassemble, and abundance jobs by phase ... \n"
+
+# One row per rule and phase (the command using the most CPU), summed over all jobs of the rule
+mkdir -p stats
+python scripts/resourceSampler.py render "benchmarks/*.timeline.tsv" --output stats/timeline_phases.tsv
+column -t -s $'\t' stats/timeline_phases.tsv
+echo -e "\nPer job breakdowns: python scripts/resourceSampler.py render 'benchmarks/*.RULE.timeline.tsv' --per_job"
+
+}
+
+# Run phaseReport task
+run_phaseReport() {
+
+echo -e "Summarizing phase events of the jobs in logs/events ... \n"
+
+# Latency distribution of each rule and phase across jobs, and the share of time spent staging data versus compute
+mkdir -p stats
+python scripts/phaseEvents.py collect logs/events --output stats/phase_latency.tsv
+column -t -s $'\t' stats/phase_latency.tsv
+
+}
+
+# Run previewReport task
+run_previewReport() {
+
+previewRoot=$(awk '/^preview:/{f=1;next} /^[^ ]/{f=0} f && $1=="root:" {print $2}' config.yaml)
+echo -e "Comparing preview runs in $previewRoot ... \n"
+
+# One row per preview run and bin tool, with the config values that differ between runs as extra columns
+mkdir -p stats
+python scripts/preview.py report $previewRoot --output stats/preview_report.tsv
+column -t -s $'\t' stats/preview_report.tsv
+
+}
+
+# Preview runs use their own project root and optional parameter overrides, passed to snakemake as extra config
+setPreview() {
+
+    previewCmd=""
+    if [[ ! -z "$preview" ]]; then
+
+        if [ $task != "megahit" ] && [ $task != "crossMapSeries" ] && [ $task != "crossMapPartners" ] && [ $task != "kallistoIndex" ] && [ $task != "crossMapParallel" ] && [ $task != "concoct" ] && [ $task != "metabat" ] && [ $task != "maxbin" ] && [ $task != "binRefine" ]; then
+            echo "Preview runs cover the core workflow tasks megahit to binRefine, not $task ... " && exit 1
+        fi
+
+        echo "Running $task as preview run $preview on subsampled reads ... "
+        previewCmd="previewName=$preview"
+        if [ -f ../config/preview/$preview.yaml ]; then
+            echo "Overriding config.yaml parameters with ../config/preview/$preview.yaml ... "
+            previewCmd="$previewCmd --configfile ../config/preview/$preview.yaml"
+        fi
+
+    fi
 
 }
 
@@ -311,7 +360,7 @@ snakePrep() {
     snakemake --unlock -j 1
 
     echo -e "\nDry-running snakemake jobs ... "
-    snakemake all -j $njobs -n -k --cluster-config ../config/cluster_config.json -c "sbatch -A {cluster.account} -t {cluster.time} -n {cluster.n} --ntasks {cluster.tasks} --cpus-per-task {cluster.n} --output {cluster.output}"
+    snakemake all --config task=$task $previewCmd -j $njobs -n -k --profile ../config/slurm --cluster-config ../config/cluster_config.json -c "$sbatchCmd"
 }
 
 # Submit login node function, note that is only works for rules with no wildcard expansion
@@ -319,6 +368,8 @@ submitLogin() {
 
     echo "No need to parse Snakefile for target rule: $task ... "
 
+    # Only the requested rule runs on the login node, missing upstream outputs are reported instead of generated here
+
     checkParams
 
     snakeConfig
@@ -330,7 +381,7 @@ submitLogin() {
     while true; do
         read -p "Do you wish to submit this $task job? (y/n)" yn
         case $yn in
-            [Yy]* ) snakemake $task -j 1; break;;
+            [Yy]* ) snakemake $task -j 1 --allowed-rules $task; break;;
             [Nn]* ) exit;;
             * ) echo "Please answer yes or no.";;
         esac
@@ -341,9 +392,8 @@ submitLogin() {
 # Submit local function, similar to submitLogin() but can handle wildcard expanded rules for non-cluster usage
 submitLocal() {
 
-    # Parse Snakefile rule all (line 22 of Snakefile) input to match output of desired target rule stored in "$string". Note: Hardcoded line number.
-    echo "Parsing Snakefile to target rule: $task ... "
-    sed  -i "22s~^.*$~        $string~" Snakefile
+    # Target files of the requested task are selected by rule all in the Snakefile, passed as --config task=$task
+    echo "Targeting rule: $task ... "
 
     checkParams
 
@@ -353,12 +403,12 @@ submitLocal() {
     snakemake --unlock -j 1
 
     echo -e "\nDry-running snakemake jobs ... "
-    snakemake all -n
+    snakemake all --config task=$task $previewCmd -n
 
     while true; do
         read -p "Do you wish to submit this batch of jobs on your local machine? (y/n)" yn
         case $yn in
-            [Yy]* ) echo "snakemake all -j $njobs -k"|bash; break;;
+            [Yy]* ) echo "snakemake all --config task=$task $previewCmd -j $njobs -k"|bash; break;;
             [Nn]* ) exit;;
             * ) echo "Please answer yes or no.";;
         esac
@@ -369,9 +419,13 @@ submitLocal() {
 # Submit cluster function
 submitCluster() {
 
-    # Parse Snakefile rule all (line 22 of Snakefile) input to match output of desired target rule stored in "$string". Note: Hardcoded line number.
-    echo "Parsing Snakefile to target rule: $task ... "
-    sed  -i "22s~^.*$~        $string~" Snakefile
+    # Target files of the requested task are selected by rule all in the Snakefile, passed as --config task=$task
+    echo "Targeting rule: $task ... "
+
+    # Resource flags override cluster_config.json values on the sbatch command line, config files are never edited
+    clusterTime="{cluster.time}"
+    clusterCores="{cluster.n}"
+    clusterMem=""
 
     # Check if the number of jobs flag is specified by user for cluster job
     if [[ -z "$njobs" ]]; then
@@ -391,9 +445,8 @@ submitCluster() {
 
     else
 
-        # Parse cluster_config.json cores (line 5) to match number requested cores stored in "$ncores". Note: Hardcoded line number.
-        echo "Parsing cluster_config.json to match requested number of cores: $ncores ... "
-        sed -i "5s/:.*$/: $ncores,/" ../config/cluster_config.json
+        echo "Requesting number of cores: $ncores ... "
+        clusterCores="$ncores"
 
     fi 
 
@@ -405,50 +458,54 @@ submitCluster() {
 
     else
 
-        # Parse cluster_config.json time (line 4) to match number requested hours stored in "$hours". Note: Hardcoded line number.
-        echo "Parsing cluster_config.json to match requested time (hours): $hours ... "
-        sed -i "4s/:.*$/: \"0-$hours:00:00\",/" ../config/cluster_config.json
+        echo "Requesting time (hours): $hours ... "
+        clusterTime="0-$hours:00:00"
 
     fi 
 
-    # Check if memory input argument was provided by user. If so, parse cluster_config.json memory (line 7) to match requested memory stored in "$mem". Note: Hardcoded line number.
+    # Check if memory input argument was provided by user
     if [[ -z "$mem" ]]; then
 
         # No memory flag provided.
         echo "WARNING: User is requesting to submit cluster job without specifying the memory flag (-m) ... "
 
-        checkParams
+    else
 
-        snakePrep
+        echo "Requesting memory: $mem ... "
+        clusterMem="--mem $(echo $mem)G"
 
-        while true; do
-            read -p "Do you wish to submit this batch of $task jobs? (y/n)" yn
-            case $yn in
-                [Yy]* ) echo "nohup snakemake all -j $njobs -k --cluster-config ../config/cluster_config.json -c 'sbatch -A {cluster.account} -t {cluster.time} -n {cluster.n} --ntasks {cluster.tasks} --cpus-per-task {cluster.n} --output {cluster.output}' &"|bash; break;;
-                [Nn]* ) exit;;
-                * ) echo "Please answer yes or no.";;
-            esac
-        done
+    fi
 
-    else
+    # Pack small bin-level jobs into fewer, larger allocations using the Snakefile group of the task
+    groupCmd=""
+    clusterOutput="{cluster.output}"
+    if [[ ! -z "$pack" ]] && ( [ $task == "carveme" ] || [ $task == "prokka" ] || [ $task == "memote" ] ); then
 
-        # Memory flag was provided, parse cluster_config.json memory (line 7) to match number requested memory stored in "$mem". Note: Hardcoded line number.
-        echo "Parsing cluster_config.json to match requested memory: $mem ... "
-        sed -i "7s/:.*$/: $(echo $mem)G,/" ../config/cluster_config.json
+        taskCores=$(awk -v task="$task:" '/^cores:/{f=1;next} /^[^ ]/{f=0} f && $1==task {print $2}' config.yaml)
+        packSize=$(( pack / taskCores ))
+        [[ $packSize -lt 1 ]] && packSize=1
+        echo "Packing $packSize $task jobs of $taskCores cores each into every $pack core cluster job ... "
+        groupCmd="--group-components $task=$packSize"
+        clusterCores="$pack"
+        clusterOutput="logs/$task.packed.%j.out.log"
 
-        checkParams
+    fi
 
-        snakePrep
+    # Job IDs are printed alone (--parsable) for the status checks of the SLURM profile in ../config/slurm
+    sbatchCmd="sbatch --parsable -A {cluster.account} -t $clusterTime $clusterMem -n $clusterCores --ntasks {cluster.tasks} --cpus-per-task $clusterCores --output $clusterOutput"
 
-        while true; do
-            read -p "Do you wish to submit this batch of jobs? (y/n)" yn
-            case $yn in
-                [Yy]* ) echo "nohup snakemake all -j $njobs -k --cluster-config ../config/cluster_config.json -c 'sbatch -A {cluster.account} -t {cluster.time} --mem {cluster.mem} -n {cluster.n} --ntasks {cluster.tasks} --cpus-per-task {cluster.n} --output {cluster.output}' &"|bash; break;;
-                [Nn]* ) exit;;
-                * ) echo "Please answer yes or no.";;
-            esac
-        done
-    fi
+    checkParams
+
+    snakePrep
+
+    while true; do
+        read -p "Do you wish to submit this batch of $task jobs? (y/n)" yn
+        case $yn in
+            [Yy]* ) echo "nohup snakemake all --config task=$task $previewCmd -j $njobs -k $groupCmd --profile ../config/slurm --cluster-config ../config/cluster_config.json -c '$sbatchCmd' &"|bash; break;;
+            [Nn]* ) exit;;
+            * ) echo "Please answer yes or no.";;
+        esac
+    done
 
 }
 
@@ -472,178 +529,21 @@ parse() {
   elif [ $task == "stats" ]; then
     run_stats
 
- # Parse snakefile for cluster/local jobs
-  elif [ $task == "fastp" ]; then
-    string='expand(config["path"]["root"]+"/"+config["folder"]["qfiltered"]+"/{IDs}/{IDs}_R1.fastq.gz", IDs = IDs)'
-    if [ $local == "true" ]; then
-        submitLocal
-    else
-        submitCluster
-    fi
-
-  elif [ $task == "megahit" ]; then
-    string='expand(config["path"]["root"]+"/"+config["folder"]["assemblies"]+"/{IDs}/contigs.fasta.gz", IDs = IDs)'
-    if [ $local == "true" ]; then
-        submitLocal
-    else
-        submitCluster
-    fi
-
-  elif [ $task == "crossMapSeries" ]; then
-    string='expand(config["path"]["root"]+"/"+config["folder"]["concoct"]+"/{IDs}/cov", IDs = IDs)'
-    if [ $local == "true" ]; then
-        submitLocal
-    else
-        submitCluster
-    fi
-
-  elif [ $task == "kallistoIndex" ]; then
-    string='expand(config["path"]["root"]+"/"+config["folder"]["kallistoIndex"]+"/{focal}/index.kaix", focal = focal)'
-    if [ $local == "true" ]; then
-        submitLocal
-    else
-        submitCluster
-    fi
-
-  elif [ $task == "kallistoIndex" ]; then
-    string='expand(config["path"]["root"]+"/"+config["folder"]["kallistoIndex"]+"/{focal}/index.kaix", focal = focal)'
-    if [ $local == "true" ]; then
-        submitLocal
-    else
-        submitCluster
-    fi
-
-  elif [ $task == "crossMapParallel" ]; then
-    string='expand(config["path"]["root"]+"/"+config["folder"]["kallisto"]+"/{focal}/{IDs}", focal = focal , IDs = IDs)'
-    if [ $local == "true" ]; then
-        submitLocal
-    else
-        submitCluster
-    fi
-
-  elif [ $task == "run_prodigal" ]; then
-    string='expand(config["path"]["root"]+"/"+config["folder"]["prodigal"]+"/{IDs}/{IDs}_genes.gff", IDs = IDs)'
-    if [ $local == "true" ]; then
-        submitLocal
-    else
-        submitCluster
-    fi
-
-
-  elif [ $task == "run_blastp" ]; then
-    string='expand(config["path"]["root"]+"/"+config["folder"]["blastp"]+"/{IDs}.xml", IDs = IDs)'
-    if [ $local == "true" ]; then
-        submitLocal
-    else
-        submitCluster
-    fi
-
-  elif [ $task == "concoct" ]; then
-    string='expand(config["path"]["root"]+"/"+config["folder"]["concoct"]+"/{IDs}/{IDs}.concoct-bins", IDs = IDs)'
-    if [ $local == "true" ]; then
-        submitLocal
-    else
-        submitCluster
-    fi
-
-  elif [ $task == "metabat" ]; then
-    string='expand(config["path"]["root"]+"/"+config["folder"]["metabat"]+"/{IDs}/{IDs}.metabat-bins", IDs = IDs)'
-    if [ $local == "true" ]; then
-        submitLocal
-    else
-        submitCluster
-    fi
+  elif [ $task == "scratchReport" ]; then
+    run_scratchReport
 
-  elif [ $task == "maxbin" ]; then
-    string='expand(config["path"]["root"]+"/"+config["folder"]["maxbin"]+"/{IDs}/{IDs}.maxbin-bins", IDs = IDs)'
-    if [ $local == "true" ]; then
-        submitLocal
-    else
-        submitCluster
-    fi
-
-  elif [ $task == "binning" ]; then
-    string='expand(config["path"]["root"]+"/"+config["folder"]["benchmarks"]+"/{IDs}/{IDs}.binning.benchmark.txt", IDs = IDs)'
-    if [ $local == "true" ]; then
-        submitLocal
-    else
-        submitCluster
-    fi
+  elif [ $task == "previewReport" ]; then
+    run_previewReport
 
-  elif [ $task == "binRefine" ]; then
-    string='expand(config["path"]["root"]+"/"+config["folder"]["refined"]+"/{IDs}", IDs = IDs)'
-    if [ $local == "true" ]; then
-        submitLocal
-    else
-        submitCluster
-    fi
+  elif [ $task == "timelineReport" ]; then
+    run_timelineReport
 
-  elif [ $task == "binReassemble" ]; then
-    string='expand(config["path"]["root"]+"/"+config["folder"]["reassembled"]+"/{IDs}", IDs = IDs)'
-    if [ $local == "true" ]; then
-        submitLocal
-    else
-        submitCluster
-    fi
-
-  elif [ $task == "gtdbtk" ]; then
-    string='expand(config["path"]["root"]+"/"+config["folder"]["classification"]+"/{IDs}", IDs = IDs)'
-    if [ $local == "true" ]; then
-        submitLocal
-    else
-        submitCluster
-    fi
-
-  elif [ $task == "abundance" ]; then
-    string='expand(config["path"]["root"]+"/"+config["folder"]["abundance"]+"/{IDs}", IDs = IDs)'
-    if [ $local == "true" ]; then
-        submitLocal
-    else
-        submitCluster
-    fi
-
-  elif [ $task == "carveme" ]; then
-    string='expand(config["path"]["root"]+"/"+config["folder"]["GEMs"]+"/{binIDs}.xml", binIDs = binIDs)'
-    if [ $local == "true" ]; then
-        submitLocal
-    else
-        submitCluster
-    fi
-
-  elif [ $task == "smetana" ]; then
-    string='expand(config["path"]["root"]+"/"+config["folder"]["SMETANA"]+"/{IDs}_detailed.tsv", IDs = IDs)'
-    if [ $local == "true" ]; then
-        submitLocal
-    else
-        submitCluster
-    fi
-
-  elif [ $task == "memote" ]; then
-    string='expand(config["path"]["root"]+"/"+config["folder"]["memote"]+"/{gemIDs}", gemIDs = gemIDs)'
-    if [ $local == "true" ]; then
-        submitLocal
-    else
-        submitCluster
-    fi
-
-  elif [ $task == "grid" ]; then
-    string='expand(config["path"]["root"]+"/"+config["folder"]["GRiD"]+"/{IDs}", IDs = IDs)'
-    if [ $local == "true" ]; then
-        submitLocal
-    else
-        submitCluster
-    fi
-
-  elif [ $task == "prokka" ]; then
-    string='expand(config["path"]["root"]+"/"+config["folder"]["pangenome"]+"/prokka/unorganized/{binIDs}", binIDs = binIDs)'
-    if [ $local == "true" ]; then
-        submitLocal
-    else
-        submitCluster
-    fi
+  elif [ $task == "phaseReport" ]; then
+    run_phaseReport
 
-  elif [ $task == "roary" ]; then
-    string='expand(config["path"]["root"]+"/"+config["folder"]["pangenome"]+"/roary/{speciesIDs}/", speciesIDs = speciesIDs)'
+ # Submit wildcard expanded tasks to the cluster or local machine, target files are defined for each task in the Snakefile
+  elif [ $task == "fastp" ] || [ $task == "previewReads" ] || [ $task == "megahit" ] || [ $task == "crossMapSeries" ] || [ $task == "kallistoIndex" ] || [ $task == "crossMapParallel" ] || [ $task == "crossMapPartners" ] || [ $task == "run_prodigal" ] || [ $task == "run_blastp" ] || [ $task == "concoct" ] || [ $task == "metabat" ] || [ $task == "maxbin" ] || [ $task == "binRefine" ] || [ $task == "binReassemble" ] || [ $task == "gtdbtk" ] || [ $task == "gtdbtkBatch" ] || [ $task == "abundance" ] || [ $task == "carveme" ] || [ $task == "smetana" ] || [ $task == "smetanaShard" ] || [ $task == "memote" ] || [ $task == "memoteBatch" ] || [ $task == "grid" ] || [ $task == "gridCohort" ] || [ $task == "prokka" ] || [ $task == "roary" ]; then
+    setPreview
     if [ $local == "true" ]; then
         submitLocal
     else
@@ -672,6 +572,8 @@ else
         -m|--mem) shift; mem=${1} ;;
         -h|--hours) shift; hours=${1} ;;
         -l|--local) shift; local=true;;
+        -p|--pack) shift; pack=${1} ;;
+        --preview) shift; preview=${1} ;;
         --endopts) shift; break ;;
         * ) echo "Unknown option(s) provided, please read helpfile ... " && usage && exit 1;;
       esac
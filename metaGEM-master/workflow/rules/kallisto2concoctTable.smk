@@ -3,6 +3,8 @@ rule kallisto2concoctTable:
         f'{config["path"]["root"]}/{config["folder"]["kallisto"]}/{{focal}}/'
     output: 
         f'{config["path"]["root"]}/{config["folder"]["concoct"]}/{{focal}}/cov/coverage_table.tsv'
+    params:
+        samples = " ".join(IDs)
     message:
         """
         This rule is necessary for the crossMapParallel implementation subworkflow.
@@ -17,9 +19,16 @@ rule kallisto2concoctTable:
         # Create output folder
         mkdir -p $(dirname {output})
 
+        # With crossMapPartners:topK set, samples that were not partners get zero coverage columns
+        allSamples=""
+        if [ {config[crossMapPartners][topK]} -gt 0 ]; then
+            allSamples="--all_samples {params.samples}"
+        fi
+
         # Compile individual mapping results into coverage table for given assembly
         python {config[path][root]}/{config[folder][scripts]}/{config[scripts][kallisto2concoct]} \
             --samplenames <(for s in {input}/*; do echo $s|sed 's|^.*/||'; done) \
-            $(find {input} -name "*.gz") > {output}
+            $(find {input} -name "abundance.tsv.*") \
+            $allSamples > {output}
     
         """
\ No newline at end of file
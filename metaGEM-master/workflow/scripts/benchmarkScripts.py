@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+Offline benchmark of the metaGEM python scripts on synthetic projects of increasing size.
+For each scale, a project with that many samples is generated by synthCommunity.py (fake tool outputs only, unless
+--reads is set), and each script is run on it the way the Snakefile runs it:
+    kallisto2concoct  one focal assembly quantified against every sample
+    binFilter         CheckM filtering of the bins of every sample, one run per sample as in the pipeline
+    binDB             rebuild of the bin database from all binning and CheckM outputs
+    collectBins       collection of all reassembled dna bins
+    interactionStats  summary of the SMETANA outputs of every sample
+Wall time and peak RSS (the largest of the runs of a script) are written to a table, one row per scale and script.
+"""
+from __future__ import print_function
+import sys
+import os
+import glob
+import time
+import shutil
+import argparse
+import subprocess
+
+import synthCommunity
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+
+def kallisto2concoct(root, work):
+    focal = sorted(os.listdir(os.path.join(root, "kallisto")))[0]
+    samples = sorted(os.listdir(os.path.join(root, "kallisto", focal)))
+    names = os.path.join(work, "samplenames.txt")
+    with open(names, "w") as table:
+        table.write("".join(sample + "\n" for sample in samples))
+    files = [os.path.join(root, "kallisto", focal, sample, "abundance.tsv") for sample in samples]
+    return [(["kallisto2concoct.py"] + files + ["--samplenames", names], os.path.join(work, "concoct_inputtable.tsv"))]
+
+def binFilter(root, work):
+    runs = []
+    for folder in sorted(glob.glob(os.path.join(root, "concoct", "*", "*.concoct-bins"))):
+        sample = os.path.basename(os.path.dirname(folder))
+        output = os.path.join(work, "binFilter", sample)
+        os.makedirs(output)
+        runs.append((["binFilter.py", folder, os.path.join(root, "concoct", sample, sample + ".checkm.tsv"), output,
+                      "--min_completeness", "50", "--max_contamination", "10"], None))
+    return runs
+
+def binDB(root, work):
+    return [(["binDB.py", "rebuild", os.path.join(work, "bins.sqlite"), root], None)]
+
+def collectBins(root, work):
+    return [(["collectBins.py", "dna", os.path.join(root, "reassembled_bins"), os.path.join(work, "dna_bins")], None)]
+
+def interactionStats(root, work):
+    return [(["interactionStats.py", os.path.join(root, "SMETANA"), os.path.join(work, "sampleMedia.stats"),
+              os.path.join(work, "interactions.stats")], None)]
+
+CASES = [("kallisto2concoct", kallisto2concoct), ("binFilter", binFilter), ("binDB", binDB),
+         ("collectBins", collectBins), ("interactionStats", interactionStats)]
+
+def run(command, stdout_path):
+    # wait4 returns the resource usage of this child alone, ru_maxrss is in kilobytes on Linux
+    stdout = open(stdout_path, "w") if stdout_path else open(os.devnull, "w")
+    with stdout, open(os.devnull, "w") as stderr:
+        start = time.time()
+        process = subprocess.Popen([sys.executable, os.path.join(SCRIPTS, command[0])] + command[1:], stdout=stdout, stderr=stderr)
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.time() - start
+    code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    return elapsed, usage.ru_maxrss / 1024.0, code
+
+def benchmark(args, scale, output):
+    root = os.path.join(os.path.abspath(args.work_directory), "scale_{}".format(scale))
+    if os.path.exists(root):
+        shutil.rmtree(root)
+    generator = synthCommunity.parser().parse_args([root, "--samples", str(scale), "--genomes", str(args.genomes),
+                                                    "--genome_length", str(args.genome_length), "--depth", str(args.depth),
+                                                    "--seed", str(args.seed)] + ([] if args.reads else ["--no_reads"]))
+    start = time.time()
+    synthCommunity.generate(generator)
+    sys.stderr.write("Generated {} samples in {:.1f} s\n".format(scale, time.time() - start))
+
+    for name, case in CASES:
+        if args.scripts and name not in args.scripts:
+            continue
+        work = os.path.join(root, "benchmark", name)
+        os.makedirs(work)
+        seconds = 0.0
+        peak = 0.0
+        failed = 0
+        runs = case(root, work)
+        for command, stdout_path in runs:
+            elapsed, rss, code = run(command, stdout_path)
+            seconds += elapsed
+            peak = max(peak, rss)
+            failed += code != 0
+        output.write("{}\t{}\t{}\t{:.3f}\t{:.1f}\t{}\n".format(scale, name, len(runs), seconds, peak, failed))
+        output.flush()
+        sys.stderr.write("{} samples, {}: {:.2f} s, {:.1f} MB peak RSS{}\n".format(
+            scale, name, seconds, peak, ", {} failed runs".format(failed) if failed else ""))
+    if not args.keep:
+        shutil.rmtree(root)
+
+def main(args):
+    output = open(args.output, "w") if args.output else sys.stdout
+    output.write("samples\tscript\truns\tseconds\tmax_rss_mb\tfailed_runs\n")
+    for scale in args.scales:
+        benchmark(args, scale, output)
+    if args.output:
+        output.close()
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", nargs='+', default=[10, 100, 1000], type=int, help="Numbers of samples, default=10 100 1000")
+    parser.add_argument("--scripts", nargs='+', default=None, choices=[name for name, _ in CASES], help="Scripts to benchmark, default=all")
+    parser.add_argument("--work_directory", default="benchmarks/synthetic", help="Folder for the synthetic projects, default=benchmarks/synthetic")
+    parser.add_argument("--output", default=None, help="Write the results table here instead of stdout")
+    parser.add_argument("--genomes", default=20, type=int, help="default=20")
+    parser.add_argument("--genome_length", default=20000, type=int, help="default=20000")
+    parser.add_argument("--depth", default=10.0, type=float, help="Mean genome coverage, default=10")
+    parser.add_argument("--reads", action="store_true", help="Also simulate the paired-end reads of every sample")
+    parser.add_argument("--seed", default=420, type=int, help="default=420")
+    parser.add_argument("--keep", action="store_true", help="Keep the synthetic projects")
+    args = parser.parse_args()
+
+    sys.exit(main(args))
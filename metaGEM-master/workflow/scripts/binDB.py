@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+"""
+SQLite store of contig to bin membership across binners, bin refinement, and bin reassembly.
+add:     records the bins in a folder for one sample and tool (concoct, metabat, maxbin, refined, reassembled),
+         with their contigs, contig lengths, and optionally the CheckM metrics from a metaWRAP .stats file.
+         Called by the binning rules as they finish, replacing any previous records for that sample and tool.
+rebuild: scans the binning output folders of a project and records every sample and tool found.
+query:   lists bins, or the contigs of matching bins, e.g. all reassembled bins with completeness >= 90.
+Bin IDs follow the names used for protein_bins/ and dna_bins/ files, e.g. SAMPLE_bin.1.o for reassembled bins.
+"""
+from __future__ import print_function
+import sys
+import os
+import glob
+import gzip
+import sqlite3
+import argparse
+
+# Also runs under the python 2 metawrap environment used by binRefine and binReassemble
+EXTENSIONS = (".fa", ".fasta", ".fna", ".fa.gz", ".fasta.gz")
+TIMEOUT = 600
+
+# Bin folders and metaWRAP CheckM .stats files of each tool relative to the project root, as created by the Snakefile.
+# bin_refinement names the .stats file of each binner after its input folder, e.g. SAMPLE.concoct for SAMPLE.concoct-bins
+LAYOUT = {
+    "concoct": ("{concoct}/{sample}/{sample}.concoct-bins", "{refined}/{sample}/{sample}.concoct.stats"),
+    "metabat": ("{metabat}/{sample}/{sample}.metabat-bins", "{refined}/{sample}/{sample}.metabat.stats"),
+    "maxbin": ("{maxbin}/{sample}/{sample}.maxbin-bins", "{refined}/{sample}/{sample}.maxbin.stats"),
+    "refined": ("{refined}/{sample}/metawrap_*_bins", "{refined}/{sample}/metawrap_*_bins.stats"),
+    "reassembled": ("{reassembled}/{sample}/reassembled_bins", "{reassembled}/{sample}/reassembled_bins.stats"),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bins (
+    sample TEXT NOT NULL,
+    tool TEXT NOT NULL,
+    bin TEXT NOT NULL,
+    bin_id TEXT NOT NULL,
+    path TEXT,
+    contigs INTEGER,
+    length INTEGER,
+    completeness REAL,
+    contamination REAL,
+    gc REAL,
+    n50 INTEGER,
+    lineage TEXT,
+    PRIMARY KEY (sample, tool, bin)
+);
+CREATE TABLE IF NOT EXISTS contigs (
+    sample TEXT NOT NULL,
+    tool TEXT NOT NULL,
+    bin TEXT NOT NULL,
+    contig TEXT NOT NULL,
+    length INTEGER
+);
+CREATE INDEX IF NOT EXISTS contigs_bin ON contigs (sample, tool, bin);
+CREATE INDEX IF NOT EXISTS contigs_contig ON contigs (contig);
+CREATE INDEX IF NOT EXISTS bins_bin_id ON bins (bin_id);
+"""
+
+def connect(path):
+    folder = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    # Concurrent rules wait for each other's write transactions instead of failing straight away
+    db = sqlite3.connect(path, timeout=TIMEOUT)
+    db.executescript(SCHEMA)
+    return db
+
+def bin_name(path):
+    name = os.path.basename(path)
+    for extension in EXTENSIONS:
+        if name.endswith(extension):
+            return name[:-len(extension)]
+    return name
+
+def bin_id(sample, name):
+    # Same substitutions as the extractProteinBins and extractDnaBins rules
+    return "{}_{}".format(sample, name).replace("permissive", "p").replace("orig", "o").replace("strict", "s")
+
+def read_lengths(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    lengths = []
+    with opener(path, "rb") as fasta:
+        for line in fasta:
+            if line.startswith(b">"):
+                lengths.append([line[1:].split()[0].decode(), 0])
+            elif lengths:
+                lengths[-1][1] += len(line.strip())
+    return lengths
+
+def read_checkm(path):
+    # metaWRAP .stats files: bin completeness contamination GC lineage N50 size binner
+    metrics = {}
+    if not path:
+        return metrics
+    if not os.path.exists(path):
+        sys.stderr.write("WARNING: CheckM file {} not found, its bins are recorded without CheckM metrics\n".format(path))
+        return metrics
+    with open(path) as stats:
+        header = stats.readline().rstrip("\n").split("\t")
+        for line in stats:
+            row = dict(zip(header, line.rstrip("\n").split("\t")))
+            if "bin" in row:
+                metrics[row["bin"]] = row
+    return metrics
+
+def number(value, cast=float):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+def add(db, sample, tool, folders, checkm_files):
+    bins = sorted(path for folder in folders for path in glob.glob(os.path.join(folder, "*")) if path.endswith(EXTENSIONS))
+    metrics = {}
+    for checkm in checkm_files:
+        metrics.update(read_checkm(checkm))
+
+    bin_rows = []
+    contig_rows = []
+    for path in bins:
+        name = bin_name(path)
+        lengths = read_lengths(path)
+        stats = metrics.get(name, {})
+        bin_rows.append((sample, tool, name, bin_id(sample, name), os.path.abspath(path),
+                         len(lengths), sum(length for _, length in lengths),
+                         number(stats.get("completeness")), number(stats.get("contamination")),
+                         number(stats.get("GC")), number(stats.get("N50"), int), stats.get("lineage")))
+        contig_rows.extend((sample, tool, name, contig, length) for contig, length in lengths)
+
+    with db:
+        db.execute("DELETE FROM bins WHERE sample = ? AND tool = ?", (sample, tool))
+        db.execute("DELETE FROM contigs WHERE sample = ? AND tool = ?", (sample, tool))
+        db.executemany("INSERT INTO bins VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", bin_rows)
+        db.executemany("INSERT INTO contigs VALUES (?, ?, ?, ?, ?)", contig_rows)
+    sys.stderr.write("Recorded {} {} bins with {} contigs for sample {}\n".format(len(bin_rows), tool, len(contig_rows), sample))
+
+def run_add(args):
+    try:
+        add(connect(args.database), args.sample, args.tool, args.folders, args.checkm or [])
+    except sqlite3.Error as error:
+        # The bins themselves are already written, so a locked or unreachable database must not fail the rule
+        sys.stderr.write("Could not update bin database {}: {}\nRun binDB.py rebuild to bring it up to date\n".format(args.database, error))
+    return 0
+
+def run_rebuild(args):
+    folders = {"concoct": args.concoct, "metabat": args.metabat, "maxbin": args.maxbin,
+               "refined": args.refined, "reassembled": args.reassembled}
+    db = connect(args.database)
+    for tool in sorted(LAYOUT):
+        bin_pattern, checkm_pattern = LAYOUT[tool]
+        tool_root = os.path.join(args.root, folders[tool])
+        if not os.path.isdir(tool_root):
+            continue
+        for sample in sorted(os.listdir(tool_root)):
+            paths = dict(folders, sample=sample)
+            bin_folders = glob.glob(os.path.join(args.root, bin_pattern.format(**paths)))
+            if bin_folders:
+                add(db, sample, tool, bin_folders, glob.glob(os.path.join(args.root, checkm_pattern.format(**paths))))
+    return 0
+
+def run_query(args):
+    db = connect(args.database)
+    conditions = []
+    values = []
+    for column in ("sample", "tool", "bin_id"):
+        if getattr(args, column):
+            conditions.append("b.{} = ?".format(column))
+            values.append(getattr(args, column))
+    if args.min_completeness is not None:
+        conditions.append("b.completeness >= ?")
+        values.append(args.min_completeness)
+    if args.max_contamination is not None:
+        conditions.append("b.contamination <= ?")
+        values.append(args.max_contamination)
+    if args.contig:
+        conditions.append("b.rowid IN (SELECT b2.rowid FROM bins b2 JOIN contigs c2 ON c2.sample = b2.sample AND c2.tool = b2.tool AND c2.bin = b2.bin WHERE c2.contig = ?)")
+        values.append(args.contig)
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+
+    if args.contigs:
+        columns = ["bin_id", "contig", "length"]
+        query = ("SELECT b.bin_id, c.contig, c.length FROM bins b JOIN contigs c "
+                 "ON c.sample = b.sample AND c.tool = b.tool AND c.bin = b.bin" + where + " ORDER BY b.sample, b.tool, b.bin")
+    else:
+        columns = ["sample", "tool", "bin", "bin_id", "contigs", "length", "completeness", "contamination", "gc", "n50", "lineage", "path"]
+        query = "SELECT {} FROM bins b{} ORDER BY b.sample, b.tool, b.bin".format(", ".join("b." + column for column in columns), where)
+
+    if args.header:
+        print("\t".join(columns))
+    for row in db.execute(query, values):
+        print("\t".join("" if value is None else str(value) for value in row))
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command")
+
+    add_parser = subparsers.add_parser("add", help="Record the bins of one sample and tool")
+    add_parser.add_argument("database")
+    add_parser.add_argument("sample")
+    add_parser.add_argument("tool", choices=sorted(LAYOUT))
+    add_parser.add_argument("folders", nargs='+', help="Folder(s) containing bin fasta files")
+    add_parser.add_argument("--checkm", nargs='*', default=None, help="metaWRAP CheckM .stats file(s) for these bins")
+
+    rebuild_parser = subparsers.add_parser("rebuild", help="Record all bins found in the project folders")
+    rebuild_parser.add_argument("database")
+    rebuild_parser.add_argument("root", help="Project root folder, i.e. config.yaml path:root")
+    rebuild_parser.add_argument("--concoct", default="concoct")
+    rebuild_parser.add_argument("--metabat", default="metabat")
+    rebuild_parser.add_argument("--maxbin", default="maxbin")
+    rebuild_parser.add_argument("--refined", default="refined_bins")
+    rebuild_parser.add_argument("--reassembled", default="reassembled_bins")
+
+    query_parser = subparsers.add_parser("query", help="List matching bins, or their contigs with --contigs")
+    query_parser.add_argument("database")
+    query_parser.add_argument("--sample", default=None)
+    query_parser.add_argument("--tool", default=None, choices=sorted(LAYOUT))
+    query_parser.add_argument("--bin_id", default=None, help="e.g. SAMPLE_bin.1.o")
+    query_parser.add_argument("--contig", default=None, help="Only bins containing this contig")
+    query_parser.add_argument("--min_completeness", default=None, type=float)
+    query_parser.add_argument("--max_contamination", default=None, type=float)
+    query_parser.add_argument("--contigs", action="store_true", help="List the contigs of matching bins instead of the bins")
+    query_parser.add_argument("--header", action="store_true", help="Print a header line")
+
+    args = parser.parse_args()
+    commands = {"add": run_add, "rebuild": run_rebuild, "query": run_query}
+    if args.command not in commands:
+        parser.print_help()
+        sys.exit(1)
+    sys.exit(commands[args.command](args))
@@ -9,11 +9,21 @@ import sys
 import os
 import argparse
 import pandas as pd
-from shutil import copyfile
+from shutil import copyfile, copyfileobj
+
+from codec import open_file
+
+def find_bin(path):
+    # Bins may have been compressed with config.yaml compression:codec, they are approved as plain fasta files
+    for candidate in (path, path + ".gz", path + ".zst"):
+        if os.path.exists(candidate):
+            return candidate
+    return path
 
 def main(args):
     # Read in the checkm table
-    df = pd.read_table(args.checkm_stats, index_col=0)
+    with open_file(args.checkm_stats, "rt") as checkm_stats:
+        df = pd.read_table(checkm_stats, index_col=0)
     # extract the ids for all rows that meet the requirements
     filtered_df = df[(df['Completeness'] >= args.min_completeness) & (df['Contamination'] <= args.max_contamination)] 
     
@@ -27,8 +37,13 @@ def main(args):
         bin_destination = os.path.join(args.output_directory)
         bin_destination += '/' + os.path.basename(bin_source)
         
+        bin_source = find_bin(bin_source)
         sys.stderr.write("Copying approved bin {} from {} to {}\n".format(approved_bin, bin_source, bin_destination))
-        copyfile(bin_source, bin_destination)
+        if bin_source.endswith((".gz", ".zst")):
+            with open_file(bin_source) as source, open(bin_destination, "wb") as destination:
+                copyfileobj(source, destination)
+        else:
+            copyfile(bin_source, bin_destination)
 
     sys.stderr.write("\nApproved {} bins\n\n".format(len(approved_bins)))
 
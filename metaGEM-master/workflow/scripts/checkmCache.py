@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+"""
+Persistent cache of CheckM lineage_wf results keyed by a hash of each bin's sequences, shared across samples and reruns.
+install: writes a checkm wrapper to a folder that the binRefine and binReassemble rules put first on PATH, so the
+         CheckM runs made internally by metaWRAP bin_refinement and reassemble_bins go through the cache.
+run:     called by the wrapper. For checkm lineage_wf, looks up every bin in the cache, runs the real CheckM only on the
+         bins that are not cached, stores their results, and writes the storage/bin_stats_ext.tsv file metaWRAP reads
+         for all bins. Any other checkm command is passed through unchanged.
+report:  lists cached results with their completeness and contamination.
+Bins are hashed on their sorted sequences, ignoring contig names and order, so a bin that metaWRAP renamed or
+re-ordered is still found. Results are kept apart per CheckM installation and result affecting option.
+"""
+from __future__ import print_function
+import sys
+import os
+import ast
+import glob
+import stat
+import shutil
+import sqlite3
+import hashlib
+import argparse
+import subprocess
+
+# Also runs under the python 2 metawrap environment used by binRefine and binReassemble
+TIMEOUT = 600
+STATS = os.path.join("storage", "bin_stats_ext.tsv")
+VALUE_OPTIONS = ("-x", "--extension", "-t", "--threads", "--pplacer_threads", "--tmpdir", "-f", "--file",
+                 "-u", "--unique", "-m", "--multi", "--aai_strain", "-a", "--alignment_file", "-e", "--e_value",
+                 "-l", "--length")
+# Options that do not change CheckM results, left out of the cache namespace
+NEUTRAL_OPTIONS = ("-x", "--extension", "-t", "--threads", "--pplacer_threads", "--tmpdir", "-q", "--quiet")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkm (
+    namespace TEXT NOT NULL,
+    bin_hash TEXT NOT NULL,
+    completeness REAL,
+    contamination REAL,
+    stats TEXT NOT NULL,
+    PRIMARY KEY (namespace, bin_hash)
+);
+"""
+
+WRAPPER = """#!/bin/sh
+exec python {script} run --db {database} --checkm {checkm} -- "$@"
+"""
+
+def connect(path):
+    folder = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    db = sqlite3.connect(path, timeout=TIMEOUT)
+    db.executescript(SCHEMA)
+    return db
+
+def which(program, skip=None):
+    for folder in os.environ.get("PATH", "").split(os.pathsep):
+        path = os.path.join(folder, program)
+        if os.path.isfile(path) and os.access(path, os.X_OK) and os.path.abspath(folder) != skip:
+            return path
+    return None
+
+def bin_hash(path):
+    digests = []
+    sequence = []
+    with open(path, "rb") as fasta:
+        for line in fasta:
+            if line.startswith(b">"):
+                if sequence:
+                    digests.append(hashlib.sha1(b"".join(sequence).upper()).hexdigest())
+                sequence = []
+            else:
+                sequence.append(line.strip())
+    if sequence:
+        digests.append(hashlib.sha1(b"".join(sequence).upper()).hexdigest())
+    return hashlib.sha256("".join(sorted(digests)).encode()).hexdigest()
+
+def parse_lineage_wf(arguments):
+    # Returns the options and the bin and output folders of a checkm lineage_wf command line
+    options = []
+    positional = []
+    index = 1
+    while index < len(arguments):
+        argument = arguments[index]
+        if argument in VALUE_OPTIONS and index + 1 < len(arguments):
+            options.append((argument, arguments[index + 1]))
+            index += 2
+            continue
+        if argument.startswith("-"):
+            options.append((argument, None))
+        else:
+            positional.append(argument)
+        index += 1
+    return options, positional
+
+def namespace(checkm, options):
+    relevant = sorted("{}={}".format(option, value) for option, value in options if option not in NEUTRAL_OPTIONS)
+    return " ".join([os.path.realpath(checkm), os.environ.get("CHECKM_DATA_PATH", "")] + relevant)
+
+def read_stats(path):
+    stats = {}
+    if os.path.exists(path):
+        with open(path) as table:
+            for line in table:
+                if "\t" in line:
+                    name, values = line.rstrip("\n").split("\t", 1)
+                    stats[name] = values
+    return stats
+
+def metric(values, key):
+    try:
+        return float(ast.literal_eval(values).get(key))
+    except (ValueError, SyntaxError, TypeError, AttributeError):
+        return None
+
+def run_lineage_wf(args, arguments):
+    options, positional = parse_lineage_wf(arguments)
+    option_names = [option for option, _ in options]
+    if len(positional) != 2 or "-f" in option_names or "--file" in option_names:
+        return subprocess.call([args.checkm] + arguments)
+    bin_directory, output_directory = positional
+    extension = dict(options).get("-x") or dict(options).get("--extension") or "fna"
+    bins = dict((os.path.basename(path)[:-len(extension) - 1], path)
+                for path in glob.glob(os.path.join(bin_directory, "*." + extension)))
+
+    db = connect(args.db)
+    key = namespace(args.checkm, options)
+    hashes = dict((name, bin_hash(path)) for name, path in bins.items())
+    cached = {}
+    for name, digest in hashes.items():
+        row = db.execute("SELECT stats FROM checkm WHERE namespace = ? AND bin_hash = ?", (key, digest)).fetchone()
+        if row:
+            cached[name] = row[0]
+    missing = sorted(set(bins) - set(cached))
+    sys.stderr.write("CheckM cache: {} of {} bins in {} cached, running CheckM on {}\n".format(
+        len(cached), len(bins), bin_directory, len(missing)))
+
+    computed = {}
+    if missing:
+        subset = output_directory.rstrip("/") + ".uncached_bins"
+        if os.path.exists(subset):
+            shutil.rmtree(subset)
+        os.makedirs(subset)
+        for name in missing:
+            os.symlink(os.path.abspath(bins[name]), os.path.join(subset, os.path.basename(bins[name])))
+        command = [args.checkm] + [subset if argument == bin_directory else argument for argument in arguments]
+        code = subprocess.call(command)
+        shutil.rmtree(subset, ignore_errors=True)
+        if code != 0:
+            return code
+        computed = read_stats(os.path.join(output_directory, STATS))
+        with db:
+            for name, values in computed.items():
+                if name in hashes:
+                    db.execute("INSERT OR REPLACE INTO checkm VALUES (?, ?, ?, ?, ?)",
+                               (key, hashes[name], metric(values, "Completeness"), metric(values, "Contamination"), values))
+
+    storage = os.path.join(output_directory, "storage")
+    if not os.path.exists(storage):
+        os.makedirs(storage)
+    with open(os.path.join(output_directory, STATS), "w") as table:
+        for name in sorted(bins):
+            values = computed.get(name, cached.get(name))
+            if values is not None:
+                table.write("{}\t{}\n".format(name, values))
+    return 0
+
+def install(args):
+    checkm = which("checkm", skip=os.path.abspath(args.directory))
+    if checkm is None:
+        sys.stderr.write("checkm not found on PATH, the cache wrapper is not installed\n")
+        return 1
+    if not os.path.exists(args.directory):
+        os.makedirs(args.directory)
+    wrapper = os.path.join(args.directory, "checkm")
+    with open(wrapper, "w") as script:
+        script.write(WRAPPER.format(script=os.path.abspath(__file__), database=os.path.abspath(args.db), checkm=checkm))
+    os.chmod(wrapper, os.stat(wrapper).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    connect(args.db)
+    print(os.path.abspath(args.directory))
+    return 0
+
+def run(args):
+    arguments = args.arguments[1:] if args.arguments[:1] == ["--"] else args.arguments
+    if arguments[:1] == ["lineage_wf"]:
+        return run_lineage_wf(args, arguments)
+    return subprocess.call([args.checkm] + arguments)
+
+def report(args):
+    db = connect(args.db)
+    print("namespace\tbin_hash\tcompleteness\tcontamination")
+    for row in db.execute("SELECT namespace, bin_hash, completeness, contamination FROM checkm ORDER BY namespace, bin_hash"):
+        print("\t".join("" if value is None else str(value) for value in row))
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command")
+
+    install_parser = subparsers.add_parser("install", help="Write a caching checkm wrapper to a folder and print its path")
+    install_parser.add_argument("directory", help="Folder to put first on PATH")
+    install_parser.add_argument("--db", required=True, help="Cache database, e.g. stats/checkm_cache.sqlite")
+
+    run_parser = subparsers.add_parser("run", help="Run a checkm command through the cache")
+    run_parser.add_argument("--db", required=True)
+    run_parser.add_argument("--checkm", required=True, help="Path of the real checkm executable")
+    run_parser.add_argument("arguments", nargs=argparse.REMAINDER, help="checkm arguments")
+
+    report_parser = subparsers.add_parser("report", help="List cached results")
+    report_parser.add_argument("db")
+
+    args = parser.parse_args()
+    commands = {"install": install, "run": run, "report": report}
+    if args.command not in commands:
+        parser.print_help()
+        sys.exit(1)
+    sys.exit(commands[args.command](args))
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+"""
+Job status for Snakemake's --cluster-status, used by the SLURM profile in config/slurm.
+status: prints success, running, or failed for one job ID printed by sbatch --parsable. Instead of one sacct call per
+        job and check, the states of all jobs that are still running are refreshed together with a single sacct call
+        (squeue for jobs sacct does not know yet) at most every MAX_AGE seconds, and kept in a cache file shared by
+        all status checks of a Snakemake run. Jobs that neither sacct nor squeue report for MISSING_SECONDS fail.
+fake:   writes sbatch, sacct, and squeue stand-ins into a folder that run each submitted job script as a local
+        background process, so the profile and status checks can be tested without SLURM:
+            python scripts/clusterStatus.py fake /tmp/fakeslurm && PATH=/tmp/fakeslurm:$PATH bash metaGEM.sh -t fastp -j 2
+        Every call of the stand-ins is logged to calls.log in that folder.
+"""
+from __future__ import print_function
+import sys
+import os
+import re
+import json
+import time
+import fcntl
+import argparse
+import subprocess
+
+SUCCESS = ("COMPLETED",)
+RUNNING = ("PENDING", "CONFIGURING", "RUNNING", "COMPLETING", "REQUEUED", "REQUEUE_FED", "REQUEUE_HOLD", "RESIZING",
+           "SUSPENDED", "SIGNALING", "STAGE_OUT", "STOPPED", "UNKNOWN")
+# Any other state, e.g. FAILED, TIMEOUT, CANCELLED, NODE_FAIL, OUT_OF_MEMORY, PREEMPTED, BOOT_FAIL, DEADLINE
+
+def job_id(text):
+    # sbatch --parsable prints ID or ID;CLUSTER, array jobs are ID_TASK
+    match = re.search(r"[0-9]+(_[0-9]+)?", text)
+    if not match:
+        raise ValueError("No job ID in {!r}".format(text))
+    return match.group(0)
+
+def verdict(state):
+    # sacct states may carry a reason, e.g. "CANCELLED by 1234"
+    state = state.split()[0].rstrip("+") if state.strip() else "UNKNOWN"
+    if state in SUCCESS:
+        return "success"
+    if state in RUNNING:
+        return "running"
+    return "failed"
+
+def query(command):
+    # None when the scheduler could not be asked, as opposed to an empty answer
+    try:
+        output = subprocess.check_output(command, stderr=subprocess.PIPE)
+    except (OSError, subprocess.CalledProcessError) as error:
+        sys.stderr.write("{} failed: {}\n".format(command[0], error))
+        return None
+    states = {}
+    for line in output.decode().splitlines():
+        fields = line.strip().split("|")
+        if len(fields) >= 2 and fields[0]:
+            states[fields[0]] = fields[1]
+    return states
+
+def poll(jobs):
+    # One call for all jobs, -X leaves out the batch and extern steps of each job
+    ids = ",".join(sorted(jobs))
+    states = query(["sacct", "-X", "-n", "-P", "-j", ids, "--format", "JobID,State"])
+    if states is None:
+        return None
+    # Accounting lags behind submission, newly submitted jobs may only be listed by squeue
+    missing = [job for job in jobs if job not in states]
+    if missing:
+        queued = query(["squeue", "-h", "-j", ",".join(sorted(missing)), "-o", "%i|%T"])
+        if queued is None:
+            return None
+        states.update(queued)
+    return states
+
+def status(args):
+    job = job_id(args.job_id)
+    folder = os.path.dirname(os.path.abspath(args.cache))
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    # Concurrent status checks wait for the one refreshing the cache instead of querying the scheduler themselves
+    with open(args.cache + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(args.cache) as handle:
+                cache = json.load(handle)
+        except (IOError, ValueError):
+            cache = {"time": 0, "jobs": {}}
+        jobs = cache["jobs"]
+        now = time.time()
+        changed = job not in jobs
+        if changed:
+            jobs[job] = {"state": "UNKNOWN", "seen": None, "first": now}
+
+        # A job submitted since the last refresh is reported as running until the next one
+        if now - cache["time"] >= args.max_age:
+            pending = [name for name, entry in jobs.items() if verdict(entry["state"]) == "running"]
+            states = poll(pending) if pending else {}
+            # After a failed query the cached states, refresh time, and missing timers are kept, so the next check
+            # asks again and only jobs the scheduler positively no longer lists are failed as missing
+            if states is not None:
+                for name in pending:
+                    if name in states:
+                        jobs[name].update(state=states[name], seen=now)
+                    elif now - (jobs[name]["seen"] or jobs[name]["first"]) > args.missing_seconds:
+                        jobs[name]["state"] = "MISSING"
+                cache["time"] = now
+                # Finished jobs are only kept long enough to answer the last checks of the run
+                for name in [name for name, entry in jobs.items() if verdict(entry["state"]) != "running" and now - entry["first"] > args.keep_seconds]:
+                    del jobs[name]
+                jobs.setdefault(job, {"state": "UNKNOWN", "seen": None, "first": now})
+                changed = True
+
+        if changed:
+            with open(args.cache + ".tmp", "w") as handle:
+                json.dump(cache, handle)
+            os.rename(args.cache + ".tmp", args.cache)
+
+    print(verdict(jobs[job]["state"]))
+    return 0
+
+SHIM = """#!/bin/sh
+exec {python} {script} fake-{command} {folder} "$@"
+"""
+
+def fake(args):
+    folder = os.path.abspath(args.folder)
+    if not os.path.exists(os.path.join(folder, "jobs")):
+        os.makedirs(os.path.join(folder, "jobs"))
+    for command in ("sbatch", "sacct", "squeue"):
+        path = os.path.join(folder, command)
+        with open(path, "w") as shim:
+            shim.write(SHIM.format(python=sys.executable, script=os.path.abspath(__file__), command=command, folder=folder))
+        os.chmod(path, 0o755)
+    print(folder)
+    return 0
+
+def log_call(folder, argv):
+    with open(os.path.join(folder, "calls.log"), "a") as calls:
+        calls.write("{:.3f}\t{}\n".format(time.time(), " ".join(argv)))
+
+def fake_sbatch(folder, argv):
+    # Options are accepted and ignored, except --output, the job script is the last argument
+    with open(os.path.join(folder, "jobs.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        counter = os.path.join(folder, "last_job")
+        job = int(open(counter).read()) + 1 if os.path.exists(counter) else 1000
+        with open(counter, "w") as handle:
+            handle.write(str(job))
+    output = os.path.join(folder, "jobs", "{}.out.log".format(job))
+    for index, option in enumerate(argv[:-1]):
+        if option in ("--output", "-o"):
+            output = argv[index + 1].replace("%j", str(job)).replace("%N", "localhost")
+    base = os.path.join(folder, "jobs", str(job))
+    # The exit code is written by the job's own shell once the script returns
+    command = "bash {script} > {output} 2>&1; echo $? > {base}.exit.tmp; mv {base}.exit.tmp {base}.exit".format(
+        script=argv[-1], output=output, base=base)
+    # Detached from the caller's pipes, so sbatch returns right away as it does on a cluster
+    with open(os.devnull, "r+") as null:
+        subprocess.Popen(["sh", "-c", command], stdin=null, stdout=null, stderr=null, close_fds=True, preexec_fn=os.setsid,
+                         env=dict(os.environ, SLURM_JOB_ID=str(job)))
+    print(job if "--parsable" in argv else "Submitted batch job {}".format(job))
+    return 0
+
+def fake_states(folder):
+    states = {}
+    for name in os.listdir(os.path.join(folder, "jobs")):
+        if re.match(r"^[0-9]+\.exit$", name):
+            with open(os.path.join(folder, "jobs", name)) as handle:
+                states[name.split(".")[0]] = "COMPLETED" if handle.read().strip() == "0" else "FAILED"
+    counter = os.path.join(folder, "last_job")
+    last = int(open(counter).read()) if os.path.exists(counter) else 999
+    for job in range(1000, last + 1):
+        states.setdefault(str(job), "RUNNING")
+    return states
+
+def requested(argv):
+    for index, option in enumerate(argv[:-1]):
+        if option in ("-j", "--jobs"):
+            return set(argv[index + 1].split(","))
+    return None
+
+def fake_sacct(folder, argv):
+    jobs = requested(argv)
+    for job, state in sorted(fake_states(folder).items()):
+        if jobs is None or job in jobs:
+            print("{}|{}".format(job, state))
+    return 0
+
+def fake_squeue(folder, argv):
+    jobs = requested(argv)
+    for job, state in sorted(fake_states(folder).items()):
+        if state == "RUNNING" and (jobs is None or job in jobs):
+            print("{}|{}".format(job, state))
+    return 0
+
+FAKES = {"fake-sbatch": fake_sbatch, "fake-sacct": fake_sacct, "fake-squeue": fake_squeue}
+
+if __name__ == "__main__":
+    # The stand-ins pass their arguments through untouched, scheduler options are not parsed by argparse
+    if len(sys.argv) > 2 and sys.argv[1] in FAKES:
+        log_call(sys.argv[2], [sys.argv[1][5:]] + sys.argv[3:])
+        sys.exit(FAKES[sys.argv[1]](sys.argv[2], sys.argv[3:]))
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command")
+
+    status_parser = subparsers.add_parser("status", help="Print success, running, or failed for a job")
+    status_parser.add_argument("job_id", help="Job ID as printed by sbatch --parsable")
+    status_parser.add_argument("--cache", default=os.path.join(".snakemake", "cluster_status.json"), help="default=.snakemake/cluster_status.json")
+    status_parser.add_argument("--max_age", default=10.0, type=float, help="Seconds a cached state is used before the scheduler is queried again, default=10")
+    status_parser.add_argument("--missing_seconds", default=300.0, type=float, help="Seconds a job may be unknown to sacct and squeue before it is failed, default=300")
+    status_parser.add_argument("--keep_seconds", default=86400.0, type=float, help="Seconds finished jobs are kept in the cache, default=86400")
+
+    fake_parser = subparsers.add_parser("fake", help="Write local sbatch, sacct, and squeue stand-ins into a folder")
+    fake_parser.add_argument("folder", help="Folder to put first on PATH, e.g. /tmp/fakeslurm")
+
+    args = parser.parse_args()
+    commands = {"status": status, "fake": fake}
+    if args.command not in commands:
+        parser.print_help()
+        sys.exit(1)
+    sys.exit(commands[args.command](args))
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""
+Compression layer shared by the Snakefile rules and the python scripts, configured by config.yaml compression:.
+cat:      decompresses files of any supported codec (plain, gzip, BGZF, zstd) to stdout, detected from their magic bytes,
+          so files written before the codec was changed stay readable. BGZF assemblies are inflated block-wise by a
+          pool of threads, gzip and zstd are piped through pigz and zstd when installed.
+compress: compresses a file with pigz (parallel gzip), gzip, or zstd using several threads, writing FILE.gz or FILE.zst.
+Python scripts use open_file() to read either codec transparently.
+"""
+from __future__ import print_function
+import sys
+import os
+import io
+import gzip
+import zlib
+import struct
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+EXTENSIONS = {"pigz": ".gz", "gzip": ".gz", "zstd": ".zst"}
+CHUNK = 4 * 1024 * 1024
+BGZF_BATCH = 256
+
+def which(program):
+    for folder in os.environ.get("PATH", "").split(os.pathsep):
+        path = os.path.join(folder, program)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+def detect(path):
+    with open(path, "rb") as handle:
+        header = handle.read(18)
+    if header[:4] == ZSTD_MAGIC:
+        return "zstd"
+    if header[:2] == GZIP_MAGIC:
+        return "bgzf" if header[3:4] == b"\x04" and header[12:14] == b"BC" else "gzip"
+    return "plain"
+
+class PipeReader(io.RawIOBase):
+    """Read end of a decompression process, which fails loudly if the process does."""
+
+    def __init__(self, command):
+        self.command = command
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.process.stdout.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.process.stdout.close()
+            code = self.process.wait()
+            super(PipeReader, self).close()
+            if code not in (0, -13):
+                raise IOError("{} exited with code {}".format(" ".join(self.command), code))
+
+def bgzf_blocks(handle):
+    # Yields the deflated payload of each BGZF block, reading block headers only
+    while True:
+        header = handle.read(18)
+        if len(header) < 18:
+            return
+        block_size = struct.unpack("<H", header[16:18])[0] + 1
+        payload = handle.read(block_size - 18)
+        yield payload[:-8]
+
+def inflate(payload):
+    return zlib.decompress(payload, -15)
+
+def cat_bgzf(path, output, threads):
+    with open(path, "rb") as handle, ThreadPoolExecutor(max_workers=threads) as pool:
+        batch = []
+        for payload in bgzf_blocks(handle):
+            batch.append(payload)
+            if len(batch) >= BGZF_BATCH:
+                for block in pool.map(inflate, batch):
+                    output.write(block)
+                batch = []
+        for block in pool.map(inflate, batch):
+            output.write(block)
+
+def decompress_command(codec, path, threads):
+    if codec in ("gzip", "bgzf") and which("pigz"):
+        return ["pigz", "-dc", "-p", str(threads), path]
+    if codec == "zstd" and which("zstd"):
+        return ["zstd", "-dcq", "-T{}".format(threads), path]
+    return None
+
+def open_file(path, mode="rb", threads=2):
+    """Opens a plain, gzip, BGZF, or zstd compressed file for reading in binary ("rb") or text ("rt"/"r") mode."""
+    codec = detect(path)
+    if codec == "plain":
+        raw = open(path, "rb")
+    else:
+        command = decompress_command(codec, path, threads)
+        if command:
+            raw = io.BufferedReader(PipeReader(command), CHUNK)
+        elif codec == "zstd":
+            import zstandard
+            raw = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        else:
+            raw = gzip.open(path, "rb")
+    return raw if "b" in mode else io.TextIOWrapper(raw)
+
+def cat(args):
+    output = getattr(sys.stdout, "buffer", sys.stdout)
+    for path in args.inputs:
+        codec = detect(path)
+        if codec == "bgzf":
+            cat_bgzf(path, output, args.threads)
+            continue
+        command = decompress_command(codec, path, args.threads)
+        if command:
+            output.flush()
+            code = subprocess.call(command, stdout=output)
+            if code != 0:
+                return code
+            continue
+        with open_file(path, "rb") as handle:
+            for chunk in iter(lambda: handle.read(CHUNK), b""):
+                output.write(chunk)
+    output.flush()
+    return 0
+
+def compress_command(codec, level, threads):
+    if codec == "zstd":
+        if not which("zstd"):
+            raise IOError("zstd not found, install it or set compression: codec: pigz in config.yaml")
+        return ["zstd", "-q", "-{}".format(level), "-T{}".format(threads), "-c"]
+    if codec == "pigz" and which("pigz"):
+        return ["pigz", "-{}".format(level), "-p", str(threads), "-c"]
+    return None
+
+def compress(args):
+    output_path = args.input + EXTENSIONS[args.codec]
+    try:
+        command = compress_command(args.codec, args.level, args.threads)
+    except IOError as error:
+        sys.stderr.write("{}\n".format(error))
+        return 1
+    with open(output_path + ".tmp", "wb") as output:
+        if command:
+            with open(args.input, "rb") as source:
+                code = subprocess.call(command, stdin=source, stdout=output)
+            if code != 0:
+                os.remove(output_path + ".tmp")
+                return code
+        else:
+            if args.codec == "pigz":
+                sys.stderr.write("pigz not found, compressing {} with single threaded gzip\n".format(args.input))
+            with open(args.input, "rb") as source, gzip.GzipFile(fileobj=output, mode="wb", compresslevel=args.level) as compressed:
+                for chunk in iter(lambda: source.read(CHUNK), b""):
+                    compressed.write(chunk)
+    os.rename(output_path + ".tmp", output_path)
+    if not args.keep:
+        os.remove(args.input)
+    print(output_path)
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command")
+
+    cat_parser = subparsers.add_parser("cat", help="Decompress files of any supported codec to stdout")
+    cat_parser.add_argument("inputs", nargs='+')
+    cat_parser.add_argument("--threads", default=2, type=int, help="default=2")
+
+    compress_parser = subparsers.add_parser("compress", help="Compress a file to FILE.gz or FILE.zst")
+    compress_parser.add_argument("input")
+    compress_parser.add_argument("--codec", default="pigz", choices=sorted(EXTENSIONS), help="default=pigz")
+    compress_parser.add_argument("--level", default=6, type=int, help="default=6")
+    compress_parser.add_argument("--threads", default=2, type=int, help="default=2")
+    compress_parser.add_argument("--keep", action="store_true", help="Keep the uncompressed input file")
+
+    args = parser.parse_args()
+    commands = {"cat": cat, "compress": compress}
+    if args.command not in commands:
+        parser.print_help()
+        sys.exit(1)
+    sys.exit(commands[args.command](args))
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""
+Collects reassembled bins into a flat folder under their metaGEM bin IDs (e.g. SAMPLE_bin.1.o), either the
+ORF annotated protein fasta files from the reassembly CheckM output (protein) or the bin fasta files (dna).
+Files are copied or linked by a pool of threads, and a manifest records the source, size, mtime, and checksum
+of each collected bin so that bins whose destination is already up to date are skipped when the step is re-run.
+The sorted bin IDs are written to a text file, which the Snakefile reads to expand the binIDs wildcard.
+"""
+from __future__ import print_function
+import sys
+import os
+import glob
+import shutil
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from binDB import bin_id
+
+MANIFEST = ".collectBins.tsv"
+IDS = "binIDs.txt"
+CHUNK = 16 * 1024 * 1024
+
+# Source pattern relative to the reassembled_bins folder and output extension of each kind of bin
+SOURCES = {
+    "protein": ("*/reassembled_bins.checkm/bins/*/genes.faa", ".faa"),
+    "dna": ("*/reassembled_bins/*.fa", ".fa"),
+}
+
+def find_bins(reassembled, kind):
+    pattern, extension = SOURCES[kind]
+    bins = {}
+    for path in glob.glob(os.path.join(reassembled, pattern)):
+        relative = os.path.relpath(path, reassembled).split(os.sep)
+        sample = relative[0]
+        name = relative[-2] if kind == "protein" else relative[-1][:-len(extension)]
+        bins[bin_id(sample, name)] = path
+    return bins, extension
+
+def read_manifest(path):
+    manifest = {}
+    if os.path.exists(path):
+        with open(path) as entries:
+            next(entries, None)
+            for line in entries:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) == 6:
+                    manifest[fields[0]] = fields
+    return manifest
+
+def checksum(path, destination=None):
+    # Hashes while copying when a destination is given, so copied bins are only read once
+    digest = hashlib.blake2b()
+    with open(path, "rb") as source:
+        output = open(destination, "wb") if destination else None
+        try:
+            for chunk in iter(lambda: source.read(CHUNK), b""):
+                digest.update(chunk)
+                if output:
+                    output.write(chunk)
+        finally:
+            if output:
+                output.close()
+    return digest.hexdigest()
+
+def up_to_date(entry, source_stat, destination):
+    if entry is None or not os.path.lexists(destination):
+        return False
+    _, source, size, mtime, _, _ = entry
+    return int(size) == source_stat.st_size and int(mtime) == source_stat.st_mtime_ns
+
+def collect(item, output_directory, extension, policy, manifest):
+    identifier, source = item
+    destination = os.path.join(output_directory, identifier + extension)
+    source_stat = os.stat(source)
+    entry = manifest.get(identifier)
+    if up_to_date(entry, source_stat, destination):
+        return entry, False
+
+    tmp_destination = destination + ".tmp"
+    if os.path.lexists(tmp_destination):
+        os.remove(tmp_destination)
+    if policy == "copy":
+        digest = checksum(source, tmp_destination)
+        shutil.copystat(source, tmp_destination)
+    else:
+        digest = checksum(source)
+        if policy == "hardlink":
+            os.link(source, tmp_destination)
+        else:
+            os.symlink(os.path.abspath(source), tmp_destination)
+    os.rename(tmp_destination, destination)
+    return [identifier, os.path.abspath(source), str(source_stat.st_size), str(source_stat.st_mtime_ns), digest, policy], True
+
+def main(args):
+    bins, extension = find_bins(args.reassembled_directory, args.kind)
+    if not bins:
+        sys.stderr.write("No {} bins found in {}\n".format(args.kind, args.reassembled_directory))
+        return 1
+    if not os.path.exists(args.output_directory):
+        os.makedirs(args.output_directory)
+
+    manifest_path = args.manifest or os.path.join(args.output_directory, MANIFEST)
+    manifest = read_manifest(manifest_path)
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(lambda item: collect(item, args.output_directory, extension, args.policy, manifest), sorted(bins.items())))
+
+    with open(manifest_path + ".tmp", "w") as entries:
+        entries.write("bin_id\tsource\tsize\tmtime_ns\tblake2b\tpolicy\n")
+        for entry, _ in results:
+            entries.write("\t".join(entry) + "\n")
+    os.rename(manifest_path + ".tmp", manifest_path)
+
+    ids_path = args.ids or os.path.join(args.output_directory, IDS)
+    with open(ids_path + ".tmp", "w") as ids:
+        ids.write("".join(identifier + "\n" for identifier in sorted(bins)))
+    os.rename(ids_path + ".tmp", ids_path)
+
+    updated = sum(1 for _, changed in results if changed)
+    sys.stderr.write("Collected {} {} bins into {}: {} updated, {} already up to date\n".format(
+        len(results), args.kind, args.output_directory, updated, len(results) - updated))
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("kind", choices=sorted(SOURCES), help="Collect protein (genes.faa) or dna (.fa) bins")
+    parser.add_argument("reassembled_directory", help="reassembled_bins folder with one subfolder per sample")
+    parser.add_argument("output_directory", help="e.g. protein_bins or dna_bins")
+    parser.add_argument("--policy", default="copy", choices=["copy", "hardlink", "symlink"], help="default=copy")
+    parser.add_argument("--threads", default=4, type=int, help="Number of bins collected concurrently, default=4")
+    parser.add_argument("--manifest", default=None, help="Manifest file, default=OUTPUT_DIRECTORY/" + MANIFEST)
+    parser.add_argument("--ids", default=None, help="Bin ID list, default=OUTPUT_DIRECTORY/" + IDS)
+    args = parser.parse_args()
+
+    sys.exit(main(args))
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""
+Selects which samples are cross-mapped against each focal assembly, so cross-mapping costs O(N*k) instead of O(N^2).
+sketch: writes a FracMinHash sketch (the canonical k-mer hashes below 2^64/scaled) of a FASTA/FASTQ file set,
+        e.g. the first reads of a qfiltered sample or a focal assembly, as a sorted numpy array.
+select: for each focal assembly, estimates the fraction of its k-mers contained in each sample's reads and keeps
+        the focal sample plus the top-k other samples above a containment threshold, writing a focal/sample table.
+fill:   adds zero coverage columns for the samples that were not mapped against a focal assembly to a CONCOCT
+        coverage table or a jgi_summarize_bam_contig_depths depth file, so tables keep one column per sample. Tables
+        with coverage columns that match no sample are rejected, a fully mapped table is left unchanged.
+"""
+from __future__ import print_function
+import sys
+import os
+import gzip
+import argparse
+
+import numpy as np
+
+CHUNK_BASES = 8 * 1024 * 1024
+MASK64 = np.uint64(0xffffffffffffffff)
+SKETCH_SUFFIXES = (".assembly.npy", ".reads.npy")
+
+# A, C, G, T map to 0-3 in either case, anything else (N, IUPAC codes, separators) breaks k-mers
+CODES = np.full(256, 4, dtype=np.uint8)
+for code, bases in enumerate((b"Aa", b"Cc", b"Gg", b"Tt")):
+    for base in bytearray(bases):
+        CODES[base] = code
+
+def open_sequences(path):
+    with open(path, "rb") as handle:
+        magic = handle.read(2)
+    return gzip.open(path, "rb") if magic == b"\x1f\x8b" else open(path, "rb")
+
+def read_sequences(path, max_reads):
+    # Yields sequences from FASTA or FASTQ files, stopping after max_reads FASTQ records (0 for all)
+    with open_sequences(path) as handle:
+        first = handle.readline()
+        if first.startswith(b"@"):
+            reads = 0
+            for number, line in enumerate(handle, 1):
+                if number % 4 == 0:
+                    reads += 1
+                    if max_reads and reads >= max_reads:
+                        return
+                elif number % 4 == 1:
+                    yield line.rstrip()
+        else:
+            sequence = []
+            for line in handle:
+                if line.startswith(b">"):
+                    if sequence:
+                        yield b"".join(sequence)
+                    sequence = []
+                else:
+                    sequence.append(line.rstrip())
+            if sequence:
+                yield b"".join(sequence)
+
+def mix64(values):
+    # splitmix64 finalizer, spreads k-mer values uniformly over 64 bits
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return values ^ (values >> np.uint64(31))
+
+def kmer_hashes(buffer, k, threshold):
+    codes = CODES[np.frombuffer(buffer, dtype=np.uint8)]
+    windows = len(codes) - k + 1
+    if windows <= 0:
+        return np.empty(0, dtype=np.uint64)
+    invalid = np.concatenate(([0], np.cumsum(codes == 4)))
+    valid = (invalid[k:] - invalid[:windows]) == 0
+    codes = np.where(codes == 4, 0, codes).astype(np.uint64)
+    forward = np.zeros(windows, dtype=np.uint64)
+    reverse = np.zeros(windows, dtype=np.uint64)
+    for offset in range(k):
+        window = codes[offset:offset + windows]
+        forward = (forward << np.uint64(2)) | window
+        reverse = reverse | ((np.uint64(3) - window) << np.uint64(2 * offset))
+    hashes = mix64(np.minimum(forward, reverse)[valid])
+    return hashes[hashes < threshold]
+
+def sketch(args):
+    threshold = np.uint64(int(MASK64) // args.scaled)
+    kept = []
+    buffer = []
+    size = 0
+    with np.errstate(over="ignore"):
+        for path in args.inputs:
+            for sequence in read_sequences(path, args.max_reads):
+                # Sequences are joined with N so that no k-mer spans two reads or contigs
+                buffer.append(sequence)
+                size += len(sequence) + 1
+                if size >= CHUNK_BASES:
+                    kept.append(np.unique(kmer_hashes(b"N".join(buffer), args.k, threshold)))
+                    buffer, size = [], 0
+        if buffer:
+            kept.append(np.unique(kmer_hashes(b"N".join(buffer), args.k, threshold)))
+    hashes = np.unique(np.concatenate(kept)) if kept else np.empty(0, dtype=np.uint64)
+    with open(args.output + ".tmp", "wb") as output:
+        np.save(output, hashes)
+    os.rename(args.output + ".tmp", args.output)
+    sys.stderr.write("Sketched {} into {} hashes (k={}, scaled={})\n".format(", ".join(args.inputs), len(hashes), args.k, args.scaled))
+    return 0
+
+def sketch_name(path):
+    # SAMPLE.assembly.npy and SAMPLE.reads.npy sketches are named after their sample, which may itself contain dots
+    name = os.path.basename(path)
+    for suffix in SKETCH_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return os.path.splitext(name)[0]
+
+def select(args):
+    assemblies = dict((sketch_name(path), np.load(path)) for path in args.assemblies)
+    reads = dict((sketch_name(path), np.load(path)) for path in args.reads)
+    with open(args.output + ".tmp", "w") as table:
+        table.write("focal\tsample\tcontainment\n")
+        for focal in sorted(assemblies):
+            assembly = assemblies[focal]
+            scores = []
+            for sample in sorted(reads):
+                shared = len(np.intersect1d(assembly, reads[sample], assume_unique=True))
+                scores.append((shared / float(max(len(assembly), 1)), sample))
+            # The focal sample is always mapped against its own assembly
+            partners = [(score, sample) for score, sample in scores if sample == focal]
+            others = sorted((pair for pair in scores if pair[1] != focal and pair[0] >= args.min_containment), reverse=True)
+            partners.extend(others[:args.top_k])
+            for score, sample in sorted(partners, key=lambda pair: pair[1]):
+                table.write("{}\t{}\t{:.6f}\n".format(focal, sample, score))
+            sys.stderr.write("Focal sample {}: {} of {} samples selected\n".format(focal, len(partners), len(reads)))
+    os.rename(args.output + ".tmp", args.output)
+    return 0
+
+def fill(args):
+    with open(args.table) as table:
+        header = table.readline().rstrip("\n").split("\t")
+        rows = [line.rstrip("\n").split("\t") for line in table]
+
+    # Column names written for SAMPLE.sort BAM files: concoct_coverage_table.py drops the BAM extension with
+    # os.path.splitext, jgi_summarize_bam_contig_depths keeps the file name as is
+    if args.format == "concoct":
+        prefix = "cov_mean_sample_"
+        columns = lambda sample: [prefix + os.path.splitext(sample + ".sort")[0]]
+    else:
+        prefix = None
+        columns = lambda sample: ["{}.sort".format(sample), "{}.sort-var".format(sample)]
+    expected = [column for sample in args.samples for column in columns(sample)]
+    missing = [column for column in expected if column not in header]
+
+    # Coverage columns that match no sample mean the names above are wrong, filling would only add spurious columns
+    coverage = [column for column in header if (column.startswith(prefix) if prefix else column.endswith((".sort", ".sort-var")))]
+    unexpected = sorted(set(coverage) - set(expected))
+    if unexpected:
+        sys.stderr.write("Coverage columns of {} that match no sample: {}\n".format(args.table, ", ".join(unexpected)))
+        return 1
+    if not missing:
+        return 0
+
+    with open(args.table + ".tmp", "w") as table:
+        table.write("\t".join(header + missing) + "\n")
+        zeros = ["0"] * len(missing)
+        for row in rows:
+            table.write("\t".join(row + zeros) + "\n")
+    os.rename(args.table + ".tmp", args.table)
+    sys.stderr.write("Added {} zero columns for samples not mapped to {}\n".format(len(missing), args.table))
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command")
+
+    sketch_parser = subparsers.add_parser("sketch", help="Sketch the k-mers of FASTA/FASTQ files")
+    sketch_parser.add_argument("output", help="Sketch file, e.g. SAMPLE.reads.npy or SAMPLE.assembly.npy")
+    sketch_parser.add_argument("inputs", nargs='+', help="FASTA/FASTQ files, plain or gzipped")
+    sketch_parser.add_argument("--k", default=21, type=int, help="k-mer size, at most 31, default=21")
+    sketch_parser.add_argument("--scaled", default=1000, type=int, help="Keep 1 in SCALED k-mer hashes, default=1000")
+    sketch_parser.add_argument("--max_reads", default=0, type=int, help="Reads sketched per FASTQ file, default=0 (all)")
+
+    select_parser = subparsers.add_parser("select", help="Select the top-k cross-mapping partners of each focal sample")
+    select_parser.add_argument("output", help="focal/sample/containment table")
+    select_parser.add_argument("--assemblies", nargs='+', required=True, help="SAMPLE.assembly.npy sketches")
+    select_parser.add_argument("--reads", nargs='+', required=True, help="SAMPLE.reads.npy sketches")
+    select_parser.add_argument("--top_k", default=10, type=int, help="Partners per focal sample besides itself, default=10")
+    select_parser.add_argument("--min_containment", default=0.0, type=float, help="Minimum fraction of focal k-mers found in the reads, default=0")
+
+    fill_parser = subparsers.add_parser("fill", help="Add zero coverage columns for samples that were not mapped")
+    fill_parser.add_argument("table")
+    fill_parser.add_argument("--format", required=True, choices=["concoct", "metabat"])
+    fill_parser.add_argument("--samples", nargs='+', required=True, help="All sample IDs")
+
+    args = parser.parse_args()
+    commands = {"sketch": sketch, "select": select, "fill": fill}
+    if args.command not in commands:
+        parser.print_help()
+        sys.exit(1)
+    sys.exit(commands[args.command](args))
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+"""
+Writes one FASTA file per bin from a contig to bin membership table, e.g. CONCOCT's *_clustering_merged.csv
+(contig_id,cluster_id with a header) or a headerless tab separated contig/bin table.
+When the assembly has a .fai index (as written by finalizeAssembly.py), contigs are read by seeking into the
+plain or BGZF compressed assembly, so the cost is proportional to the binned sequence and no decompressed copy of
+the assembly is needed. Bins are written concurrently by a pool of threads, each with its own file handle.
+Assemblies without an index are streamed once and each contig is routed to its bin.
+"""
+from __future__ import print_function
+import sys
+import os
+import csv
+import gzip
+import zlib
+import struct
+import bisect
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+BGZF_MAGIC = b"\x1f\x8b\x08\x04"
+
+def is_bgzf(path):
+    with open(path, "rb") as handle:
+        header = handle.read(18)
+    return header[:4] == BGZF_MAGIC and header[12:14] == b"BC"
+
+def read_gzi(path):
+    with open(path, "rb") as gzi:
+        count = struct.unpack("<Q", gzi.read(8))[0]
+        offsets = [struct.unpack("<QQ", gzi.read(16)) for _ in range(count)]
+    return [(0, 0)] + offsets
+
+def build_gzi(path):
+    # Walks the block headers and trailers only, without decompressing anything
+    offsets = []
+    compressed = uncompressed = 0
+    with open(path, "rb") as handle:
+        while True:
+            header = handle.read(18)
+            if len(header) < 18:
+                break
+            block_size = struct.unpack("<H", header[16:18])[0] + 1
+            handle.seek(compressed + block_size - 4)
+            offsets.append((compressed, uncompressed))
+            uncompressed += struct.unpack("<I", handle.read(4))[0]
+            compressed += block_size
+    return offsets
+
+class BgzfReader(object):
+    """Random access to the uncompressed bytes of a BGZF file using its block offsets."""
+
+    def __init__(self, path, offsets):
+        self.handle = open(path, "rb")
+        self.compressed = [offset[0] for offset in offsets]
+        self.uncompressed = [offset[1] for offset in offsets]
+        self.block_start = None
+        self.block = b""
+
+    def load(self, index):
+        self.handle.seek(self.compressed[index])
+        header = self.handle.read(18)
+        block_size = struct.unpack("<H", header[16:18])[0] + 1
+        self.block = zlib.decompress(self.handle.read(block_size - 26), -15)
+        self.block_start = self.uncompressed[index]
+
+    def read(self, offset, length):
+        data = []
+        while length > 0:
+            if self.block_start is None or not self.block_start <= offset < self.block_start + len(self.block):
+                index = bisect.bisect_right(self.uncompressed, offset) - 1
+                self.load(index)
+                if not self.block:
+                    break
+            start = offset - self.block_start
+            chunk = self.block[start:start + length]
+            data.append(chunk)
+            offset += len(chunk)
+            length -= len(chunk)
+        return b"".join(data)
+
+    def close(self):
+        self.handle.close()
+
+class PlainReader(object):
+
+    def __init__(self, path):
+        self.handle = open(path, "rb")
+
+    def read(self, offset, length):
+        self.handle.seek(offset)
+        return self.handle.read(length)
+
+    def close(self):
+        self.handle.close()
+
+def read_fai(path):
+    index = {}
+    with open(path) as fai:
+        for line in fai:
+            name, length, offset, line_bases, line_width = line.split("\t")[:5]
+            index[name] = (int(offset), int(length), int(line_bases), int(line_width))
+    return index
+
+def read_membership(path):
+    bins = {}
+    with open(path) as table:
+        first = table.readline()
+        delimiter = "," if "," in first else "\t"
+        rows = csv.reader(table, delimiter=delimiter)
+        if not first.lower().startswith("contig"):
+            # Headerless table, the first line is a membership row as well
+            rows = [first.rstrip("\r\n").split(delimiter)] + list(rows)
+        for row in rows:
+            if len(row) >= 2:
+                bins.setdefault(row[1], []).append(row[0])
+    return bins
+
+def write_bin(bin_id, contigs, args, index, offsets):
+    reader = BgzfReader(args.assembly, offsets) if offsets else PlainReader(args.assembly)
+    path = os.path.join(args.output_path, "{}{}".format(bin_id, args.extension))
+    # Contigs are fetched in assembly order, so consecutive reads mostly hit the same or the next block
+    records = sorted((index[contig], contig) for contig in contigs if contig in index)
+    missing = len(contigs) - len(records)
+    with open(path + ".tmp", "wb") as fasta:
+        for (offset, length, line_bases, line_width), contig in records:
+            full_lines, remainder = divmod(length, line_bases) if line_bases else (0, 0)
+            size = full_lines * line_width + remainder if remainder else full_lines * line_width - (line_width - line_bases)
+            fasta.write(">{}\n".format(contig).encode())
+            fasta.write(reader.read(offset, size).rstrip(b"\r\n") + b"\n")
+    os.rename(path + ".tmp", path)
+    reader.close()
+    return bin_id, len(records), missing
+
+def stream_bins(bins, args):
+    # Fallback for unindexed assemblies: a single sequential pass with one open output file per bin
+    contig_bins = dict((contig, bin_id) for bin_id, contigs in bins.items() for contig in contigs)
+    handles = dict((bin_id, open(os.path.join(args.output_path, "{}{}".format(bin_id, args.extension)), "wb")) for bin_id in bins)
+    written = dict((bin_id, 0) for bin_id in bins)
+    opener = gzip.open if args.assembly.endswith(".gz") else open
+    current = None
+    with opener(args.assembly, "rb") as assembly:
+        for line in assembly:
+            if line.startswith(b">"):
+                bin_id = contig_bins.get(line[1:].split()[0].decode())
+                current = handles.get(bin_id)
+                if current is not None:
+                    written[bin_id] += 1
+            if current is not None:
+                current.write(line)
+    for handle in handles.values():
+        handle.close()
+    return [(bin_id, written[bin_id], len(bins[bin_id]) - written[bin_id]) for bin_id in sorted(bins)]
+
+def main(args):
+    bins = read_membership(args.membership)
+    if not os.path.exists(args.output_path):
+        os.makedirs(args.output_path)
+
+    fai = args.assembly + ".fai"
+    if os.path.exists(fai):
+        index = read_fai(fai)
+        offsets = None
+        if is_bgzf(args.assembly):
+            offsets = read_gzi(args.assembly + ".gzi") if os.path.exists(args.assembly + ".gzi") else build_gzi(args.assembly)
+        elif args.assembly.endswith(".gz"):
+            sys.stderr.write("{} is gzip but not BGZF compressed, ignoring its .fai index\n".format(args.assembly))
+            index = None
+    else:
+        index = None
+
+    if index is None:
+        sys.stderr.write("No usable index for {}, streaming the assembly once ... \n".format(args.assembly))
+        results = stream_bins(bins, args)
+    else:
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            results = list(pool.map(lambda item: write_bin(item[0], item[1], args, index, offsets), sorted(bins.items())))
+
+    missing = sum(result[2] for result in results)
+    sys.stderr.write("Wrote {} bins with {} contigs to {}\n".format(len(results), sum(result[1] for result in results), args.output_path))
+    if missing:
+        sys.stderr.write("{} contigs in {} were not found in {}\n".format(missing, args.membership, args.assembly))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("assembly", help="Assembly FASTA, plain or gzip/BGZF compressed, ideally with ASSEMBLY.fai (and .gzi) indexes")
+    parser.add_argument("membership", help="Contig to bin table, e.g. CONCOCT clustering_merged.csv")
+    parser.add_argument("output_path", help="Folder to write BIN.fa files to")
+    parser.add_argument("--extension", default=".fa", help="Bin file extension, default=.fa")
+    parser.add_argument("--threads", default=1, type=int, help="Number of bins written concurrently, default=1")
+    args = parser.parse_args()
+
+    sys.exit(main(args))
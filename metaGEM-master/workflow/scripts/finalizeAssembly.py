@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""
+Finalizes a MEGAHIT assembly in a single streaming pass: replaces spaces in contig headers with hyphens,
+computes contig length statistics, and writes a block compressed (BGZF) FASTA together with its samtools
+compatible .fai and .gzi indexes. BGZF files are valid gzip files, so zcat/gunzip based rules keep working,
+while indexed readers can fetch individual contigs without decompressing the whole assembly.
+Blocks are deflated concurrently by a pool of threads (zlib releases the GIL while compressing).
+"""
+from __future__ import print_function
+import sys
+import gzip
+import zlib
+import struct
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+# Uncompressed bytes per BGZF block, as used by htslib so that each compressed block fits in 64 KB
+BLOCK_SIZE = 0xff00
+BLOCKS_PER_BATCH = 64
+BGZF_HEADER = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+BGZF_EOF = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+
+def compress_block(data, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    deflated = compressor.compress(data) + compressor.flush()
+    if len(deflated) > 65536 - len(BGZF_HEADER) - 10:
+        # Incompressible data, store it instead
+        compressor = zlib.compressobj(0, zlib.DEFLATED, -15)
+        deflated = compressor.compress(data) + compressor.flush()
+    # Header, BSIZE (total block size - 1), deflated data, CRC32 and uncompressed size
+    block_size = len(BGZF_HEADER) + 2 + len(deflated) + 8
+    return (BGZF_HEADER + struct.pack("<H", block_size - 1) + deflated
+            + struct.pack("<II", zlib.crc32(data) & 0xffffffff, len(data)))
+
+class BgzfWriter(object):
+    """Buffers uncompressed bytes and writes them as BGZF blocks compressed by a thread pool, recording the .gzi index."""
+
+    def __init__(self, path, threads=1, level=6):
+        self.handle = open(path, "wb")
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+        self.level = level
+        self.buffer = bytearray()
+        self.compressed_offset = 0
+        self.uncompressed_offset = 0
+        self.index = []
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= BLOCK_SIZE * BLOCKS_PER_BATCH:
+            self.flush(final=False)
+
+    def flush(self, final=True):
+        nblocks = len(self.buffer) // BLOCK_SIZE
+        if final and len(self.buffer) % BLOCK_SIZE:
+            nblocks += 1
+        chunks = [bytes(self.buffer[i * BLOCK_SIZE:(i + 1) * BLOCK_SIZE]) for i in range(nblocks)]
+        del self.buffer[:nblocks * BLOCK_SIZE]
+        for chunk, block in zip(chunks, self.pool.map(lambda chunk: compress_block(chunk, self.level), chunks)):
+            # The .gzi index lists the start of every block except the first, which is always at (0, 0)
+            if self.compressed_offset:
+                self.index.append((self.compressed_offset, self.uncompressed_offset))
+            self.handle.write(block)
+            self.compressed_offset += len(block)
+            self.uncompressed_offset += len(chunk)
+
+    def close(self, index_path=None):
+        self.flush()
+        self.handle.write(BGZF_EOF)
+        self.handle.close()
+        self.pool.shutdown()
+        if index_path:
+            with open(index_path, "wb") as gzi:
+                gzi.write(struct.pack("<Q", len(self.index)))
+                for offsets in self.index:
+                    gzi.write(struct.pack("<QQ", *offsets))
+
+def open_fasta(path):
+    if path == "-":
+        return getattr(sys.stdin, "buffer", sys.stdin)
+    with open(path, "rb") as handle:
+        magic = handle.read(2)
+    return gzip.open(path, "rb") if magic == b"\x1f\x8b" else open(path, "rb")
+
+def n50(lengths):
+    total = sum(lengths)
+    running = 0
+    for rank, length in enumerate(sorted(lengths, reverse=True), 1):
+        running += length
+        if running * 2 >= total:
+            return length, rank
+    return 0, 0
+
+def main(args):
+    writer = BgzfWriter(args.output, threads=args.threads, level=args.level)
+    fai = open(args.output + ".fai", "w")
+    lengths = []
+    offset = 0
+    name = None
+    length = 0
+    line_bases = line_width = 0
+    last_line = False
+
+    def write_fai():
+        fai.write("{}\t{}\t{}\t{}\t{}\n".format(name, length, record_offset, line_bases, line_width))
+        lengths.append(length)
+
+    with open_fasta(args.input) as fasta:
+        for line in fasta:
+            if line.startswith(b">"):
+                if name is not None:
+                    write_fai()
+                # Spaces in MEGAHIT headers (e.g. "k141_1 flag=1 multi=2.0 len=500") break several binners
+                line = line.rstrip(b"\r\n").replace(b" ", b"-") + b"\n"
+                name = line[1:-1].decode()
+                record_offset = offset + len(line)
+                length = line_bases = line_width = 0
+                last_line = False
+            else:
+                bases = len(line.rstrip(b"\r\n"))
+                if bases == 0:
+                    continue
+                if last_line:
+                    # faidx requires every line of a sequence except the last to have the same length
+                    sys.stderr.write("Contig {} has uneven line lengths, cannot index {}\n".format(name, args.input))
+                    return 1
+                if line_bases == 0:
+                    line_bases, line_width = bases, len(line)
+                elif bases > line_bases:
+                    sys.stderr.write("Contig {} has uneven line lengths, cannot index {}\n".format(name, args.input))
+                    return 1
+                elif bases < line_bases:
+                    last_line = True
+                length += bases
+            writer.write(line)
+            offset += len(line)
+        if name is not None:
+            write_fai()
+
+    writer.close(args.output + ".gzi")
+    fai.close()
+
+    n50_length, l50 = n50(lengths)
+    stats = [len(lengths), sum(lengths), min(lengths or [0]), max(lengths or [0]), n50_length, l50]
+    if args.stats:
+        with open(args.stats, "w") as stats_file:
+            stats_file.write("contigs\tbases\tmin\tmax\tN50\tL50\n")
+            stats_file.write("\t".join(str(value) for value in stats) + "\n")
+    sys.stderr.write("Wrote {} contigs ({} bp, N50 {} bp) to {} with .fai and .gzi indexes\n".format(
+        stats[0], stats[1], n50_length, args.output))
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("input", help="Assembly FASTA, plain or gzip compressed, or - for stdin")
+    parser.add_argument("output", help="Output BGZF FASTA, indexes are written to OUTPUT.fai and OUTPUT.gzi")
+    parser.add_argument("--stats", default=None, help="Write contig count, total length, min, max, N50 and L50 to this file")
+    parser.add_argument("--threads", default=1, type=int, help="Number of compression threads, default=1")
+    parser.add_argument("--level", default=6, type=int, help="Compression level, default=6")
+    args = parser.parse_args()
+
+    sys.exit(main(args))
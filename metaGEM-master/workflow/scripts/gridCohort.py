@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+"""
+Estimates growth rates of several samples in one job against a GRiD MAG database shared by the whole cohort.
+build: builds the database once from a genome folder, e.g. dna_bins or a dereplicated genome set, caches it under
+       CACHE_DIRECTORY/KEY, where KEY is a hash of the genome file names and contents, and writes the path of the
+       database to a small file. Later runs reuse the cached database as long as the genome set is unchanged.
+run:   runs a batch of samples against the database named in that file. Reads are not concatenated into a new file:
+       each sample is exposed to grid multiplex as a named pipe fed by the R1 and R2 fastq.gz files (concatenated
+       gzip members are a valid gzip stream), or copied with --reads copy. Results are split into one
+       OUTPUT_DIRECTORY/SAMPLE folder per sample, as written by the per-sample grid rule.
+"""
+from __future__ import print_function
+import sys
+import os
+import glob
+import shutil
+import hashlib
+import argparse
+import subprocess
+
+EXTENSIONS = (".fa", ".fasta", ".fna")
+CHUNK = 16 * 1024 * 1024
+
+def genome_files(folder):
+    return sorted(path for path in glob.glob(os.path.join(folder, "*")) if path.endswith(EXTENSIONS))
+
+def database_key(genomes):
+    digest = hashlib.blake2b(digest_size=12)
+    for path in genomes:
+        digest.update(os.path.basename(path).encode() + b"\0")
+        with open(path, "rb") as genome:
+            for chunk in iter(lambda: genome.read(CHUNK), b""):
+                digest.update(chunk)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def build_database(genomes, cache_directory):
+    key = database_key(genomes)
+    database = os.path.join(cache_directory, key)
+    if os.path.exists(database):
+        sys.stderr.write("Reusing cached GRiD database {} ({} genomes)\n".format(database, len(genomes)))
+        return os.path.join(database, "MAGdb")
+
+    # Built next to the cache and renamed into place, so an interrupted build never leaves a partial database
+    build = "{}.tmp.{}".format(database, os.getpid())
+    os.makedirs(os.path.join(build, "genomes"))
+    for path in genomes:
+        os.symlink(os.path.abspath(path), os.path.join(build, "genomes", os.path.basename(path)))
+    sys.stderr.write("Building GRiD database {} from {} genomes ... \n".format(database, len(genomes)))
+    os.mkdir(os.path.join(build, "MAGdb"))
+    code = subprocess.call(["update_database", "-d", "MAGdb", "-g", "genomes", "-p", "MAGdb"], cwd=build)
+    if code != 0:
+        shutil.rmtree(build, ignore_errors=True)
+        raise RuntimeError("update_database failed with exit code {}".format(code))
+    shutil.rmtree(os.path.join(build, "genomes"))
+    try:
+        os.rename(build, database)
+    except OSError:
+        # Another project sharing the cache folder finished building the same database first
+        shutil.rmtree(build, ignore_errors=True)
+    return os.path.join(database, "MAGdb")
+
+def stage_reads(samples, reads_root, reads_directory, mode):
+    feeders = []
+    os.makedirs(reads_directory)
+    for sample in samples:
+        pair = [os.path.join(reads_root, sample, "{}_{}.fastq.gz".format(sample, read)) for read in ("R1", "R2")]
+        target = os.path.join(reads_directory, sample + ".fastq.gz")
+        if mode == "stream":
+            os.mkfifo(target)
+            # Each feeder blocks until grid opens its pipe, so samples are streamed one after the other
+            feeders.append(subprocess.Popen(["/bin/sh", "-c", 'exec cat "$1" "$2" > "$3"', "feeder"] + pair + [target]))
+        else:
+            with open(target, "wb") as combined:
+                for path in pair:
+                    with open(path, "rb") as reads:
+                        shutil.copyfileobj(reads, combined, CHUNK)
+    return feeders
+
+def split_results(samples, out_directory, output_directory):
+    entries = os.listdir(out_directory)
+    owned = dict((sample, [entry for entry in entries if entry == sample or entry.startswith(sample + ".")]) for sample in samples)
+    shared = [entry for entry in entries if not any(entry in names for names in owned.values())]
+    for sample in samples:
+        final = os.path.join(output_directory, sample)
+        tmp = final + ".tmp"
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        for entry in owned[sample]:
+            shutil.move(os.path.join(out_directory, entry), os.path.join(tmp, entry))
+        for entry in shared:
+            source = os.path.join(out_directory, entry)
+            if os.path.isdir(source):
+                shutil.copytree(source, os.path.join(tmp, entry))
+            else:
+                shutil.copy(source, os.path.join(tmp, entry))
+        if os.path.exists(final):
+            shutil.rmtree(final)
+        os.rename(tmp, final)
+
+def write_summary(path, samples, database):
+    with open(path, "w") as summary:
+        summary.write("sample\tstatus\tdatabase\n")
+        for sample in samples:
+            summary.write("{}\t{}\t{}\n".format(sample, "estimated" if database else "existing", database or ""))
+
+def build(args):
+    genomes = genome_files(args.genome_directory)
+    if not genomes:
+        sys.stderr.write("No genomes found in {}\n".format(args.genome_directory))
+        return 1
+    database = build_database(genomes, os.path.abspath(args.cache_directory))
+    with open(args.output + ".tmp", "w") as output:
+        output.write(database + "\n")
+    os.rename(args.output + ".tmp", args.output)
+    return 0
+
+def run(args):
+    samples = args.samples
+    if not args.overwrite:
+        samples = [sample for sample in samples if not os.path.isdir(os.path.join(args.output_directory, sample))]
+    if not samples:
+        sys.stderr.write("All samples already have GRiD results in {}\n".format(args.output_directory))
+        if args.summary:
+            write_summary(args.summary, args.samples, None)
+        return 0
+
+    with open(args.database) as handle:
+        database = handle.read().strip()
+    if not os.path.isdir(database):
+        sys.stderr.write("GRiD database {} named in {} does not exist, rerun the build step\n".format(database, args.database))
+        return 1
+
+    work_directory = os.path.abspath(args.work_directory)
+    reads_directory = os.path.join(work_directory, "reads")
+    out_directory = os.path.join(work_directory, "out")
+    if os.path.exists(reads_directory):
+        shutil.rmtree(reads_directory)
+    if not os.path.exists(out_directory):
+        os.makedirs(out_directory)
+    feeders = stage_reads(samples, args.reads_root, reads_directory, args.reads)
+
+    sys.stderr.write("Running GRiD on {} samples against {} ... \n".format(len(samples), database))
+    code = subprocess.call(["grid", "multiplex", "-r", reads_directory, "-e", "fastq.gz", "-d", database,
+                            "-p", "-c", str(args.coverage), "-o", out_directory, "-n", str(args.threads)])
+    for feeder in feeders:
+        # Pipes grid never opened would block their feeder forever
+        if feeder.poll() is None:
+            feeder.kill()
+        feeder.wait()
+    if code != 0:
+        sys.stderr.write("grid multiplex failed with exit code {}\n".format(code))
+        return code
+
+    split_results(samples, out_directory, args.output_directory)
+    if args.summary:
+        write_summary(args.summary, samples, database)
+    sys.stderr.write("Wrote GRiD results for {} samples to {}\n".format(len(samples), args.output_directory))
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command")
+
+    build_parser = subparsers.add_parser("build", help="Build or reuse the cached database of a genome set")
+    build_parser.add_argument("genome_directory", help="Genomes to build the database from, e.g. dna_bins or a dereplicated set")
+    build_parser.add_argument("--cache_directory", required=True, help="Folder holding the cached databases")
+    build_parser.add_argument("--output", required=True, help="File the path of the database is written to, read by run --database")
+
+    run_parser = subparsers.add_parser("run", help="Run a batch of samples against a built database")
+    run_parser.add_argument("reads_root", help="Folder with one SAMPLE/SAMPLE_R1.fastq.gz, SAMPLE_R2.fastq.gz subfolder per sample, e.g. qfiltered")
+    run_parser.add_argument("output_directory", help="GRiD folder, one subfolder per sample is written")
+    run_parser.add_argument("--samples", nargs='+', required=True, help="Sample IDs to run in this job")
+    run_parser.add_argument("--database", required=True, help="File written by build naming the database")
+    run_parser.add_argument("--work_directory", default=".", help="Folder for reads pipes and grid output, e.g. a scratch dir")
+    run_parser.add_argument("--reads", default="stream", choices=["stream", "copy"], help="default=stream")
+    run_parser.add_argument("--coverage", default=0.2, type=float, help="grid -c minimum genome coverage, default=0.2")
+    run_parser.add_argument("--threads", default=1, type=int, help="default=1")
+    run_parser.add_argument("--summary", default=None, help="Write the samples and database used to this file")
+    run_parser.add_argument("--overwrite", action="store_true", help="Rerun samples with existing results")
+
+    args = parser.parse_args()
+    commands = {"build": build, "run": run}
+    if args.command not in commands:
+        parser.print_help()
+        sys.exit(1)
+    sys.exit(commands[args.command](args))
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""
+Classifies the reassembled bins of a whole cohort with GTDB-Tk in a few large batches instead of one run per sample,
+so the reference data and pplacer tree are loaded once per batch rather than once per sample.
+Bins are passed to gtdbtk classify_wf through a batchfile pointing at the reassembled_bins folders, nothing is copied.
+The summaries of each batch are split back into per-sample OUTPUT_DIRECTORY/SAMPLE/classify/*summary.tsv files
+with the original bin names, as written by the per-sample GTDBTk rule, so compositionVis reads them unchanged.
+Samples are ordered so that each one is written as soon as the batch holding its last bin finishes, and samples
+with existing summaries are skipped, so an interrupted cohort run can be resubmitted to resume.
+"""
+from __future__ import print_function
+import sys
+import os
+import glob
+import shutil
+import argparse
+import subprocess
+
+from binDB import bin_id
+
+SUMMARY_PATTERNS = ("classify/*summary.tsv", "*summary.tsv")
+
+def sample_done(output_directory, sample):
+    return bool(glob.glob(os.path.join(output_directory, sample, "classify", "*summary.tsv")))
+
+def existing_bins(output_directory, sample):
+    # Classified bins of a sample skipped in this run, counted from the rows of its existing summaries
+    count = 0
+    for path in glob.glob(os.path.join(output_directory, sample, "classify", "*summary.tsv")):
+        with open(path) as summary:
+            count += max(sum(1 for line in summary if line.strip()) - 1, 0)
+    return count
+
+def find_genomes(folders, extension):
+    # Each folder is SAMPLE/reassembled_bins, genomes get a cohort-wide unique ID mapped back to sample and bin
+    genomes = []
+    for folder in folders:
+        sample = os.path.basename(os.path.dirname(os.path.abspath(folder)))
+        for path in sorted(glob.glob(os.path.join(folder, "*" + extension))):
+            name = os.path.basename(path)[:-len(extension)]
+            genomes.append((sample, name, bin_id(sample, name), os.path.abspath(path)))
+    return genomes
+
+def batches(genomes, batch_size):
+    for start in range(0, len(genomes), batch_size):
+        yield genomes[start:start + batch_size]
+
+def read_summaries(out_dir):
+    # GTDB-Tk versions differ in whether summaries are written to classify/ or to the output root
+    summaries = {}
+    for pattern in SUMMARY_PATTERNS:
+        for path in glob.glob(os.path.join(out_dir, pattern)):
+            name = os.path.basename(path)
+            if name in summaries:
+                continue
+            with open(path) as summary:
+                summaries[name] = [line.rstrip("\n").split("\t") for line in summary if line.strip()]
+    return summaries
+
+def write_sample(output_directory, sample, headers, rows):
+    # Written to a temporary folder and renamed, so a sample folder is only ever present when complete
+    final = os.path.join(output_directory, sample)
+    tmp = final + ".tmp"
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(os.path.join(tmp, "classify"))
+    for kind in sorted(headers):
+        with open(os.path.join(tmp, "classify", kind), "w") as summary:
+            summary.write("\t".join(headers[kind]) + "\n")
+            for row in rows.get(kind, []):
+                summary.write("\t".join(row) + "\n")
+    if os.path.exists(final):
+        shutil.rmtree(final)
+    os.rename(tmp, final)
+
+def main(args):
+    genomes = find_genomes(args.reassembled_directories, args.extension)
+    skipped = set()
+    if not args.overwrite:
+        skipped = set(genome[0] for genome in genomes if sample_done(args.output_directory, genome[0]))
+        genomes = [genome for genome in genomes if genome[0] not in skipped]
+    if not genomes:
+        sys.stderr.write("All samples already classified in {}\n".format(args.output_directory))
+    identifiers = dict((genome[2], genome) for genome in genomes)
+    remaining = {}
+    for sample, _, _, _ in genomes:
+        remaining[sample] = remaining.get(sample, 0) + 1
+
+    work_directory = os.path.abspath(args.work_directory)
+    if not os.path.exists(work_directory):
+        os.makedirs(work_directory)
+    if not os.path.exists(args.output_directory):
+        os.makedirs(args.output_directory)
+
+    headers = {}
+    sample_rows = {}
+    status = []
+    for number, batch in enumerate(batches(genomes, args.batch_size), 1):
+        batchfile = os.path.join(work_directory, "batch.{}.tsv".format(number))
+        with open(batchfile, "w") as entries:
+            for _, _, identifier, path in batch:
+                entries.write("{}\t{}\n".format(path, identifier))
+
+        out_dir = os.path.join(work_directory, "batch.{}".format(number))
+        sys.stderr.write("Classifying batch {} with {} genomes from {} samples ... \n".format(
+            number, len(batch), len(set(genome[0] for genome in batch))))
+        command = ["gtdbtk", "classify_wf", "--batchfile", batchfile, "--out_dir", out_dir, "--cpus", str(args.cpus)]
+        code = subprocess.call(command)
+        if code != 0:
+            sys.stderr.write("gtdbtk failed on batch {} with exit code {}\n".format(number, code))
+            return code
+
+        for kind, lines in read_summaries(out_dir).items():
+            headers[kind] = lines[0]
+            column = lines[0].index("user_genome") if "user_genome" in lines[0] else 0
+            for row in lines[1:]:
+                sample, name, _, _ = identifiers[row[column]]
+                row[column] = name
+                sample_rows.setdefault(sample, {}).setdefault(kind, []).append(row)
+
+        for sample, _, _, _ in batch:
+            remaining[sample] -= 1
+            if remaining[sample] == 0:
+                rows = sample_rows.pop(sample, {})
+                write_sample(args.output_directory, sample, headers, rows)
+                status.append((sample, sum(len(kind_rows) for kind_rows in rows.values()), number))
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    if args.summary:
+        with open(args.summary, "w") as summary:
+            summary.write("sample\tclassified_bins\tbatch\n")
+            for sample, classified, number in status:
+                summary.write("{}\t{}\t{}\n".format(sample, classified, number))
+            for sample in sorted(skipped):
+                summary.write("{}\t{}\texisting\n".format(sample, existing_bins(args.output_directory, sample)))
+    sys.stderr.write("Classified {} genomes from {} samples\n".format(len(genomes), len(status)))
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("reassembled_directories", nargs='+', help="SAMPLE/reassembled_bins folders to classify")
+    parser.add_argument("--output_directory", required=True, help="GTDBTk folder, one subfolder per sample is written")
+    parser.add_argument("--work_directory", default=".", help="Folder for batchfiles and batch outputs, e.g. a scratch dir")
+    parser.add_argument("--batch_size", default=1000, type=int, help="Genomes per gtdbtk classify_wf run, default=1000")
+    parser.add_argument("--cpus", default=1, type=int, help="default=1")
+    parser.add_argument("--extension", default=".fa", help="Bin file extension, default=.fa")
+    parser.add_argument("--summary", default=None, help="Write the number of classified bins and the batch of each sample to this file, existing for skipped samples")
+    parser.add_argument("--overwrite", action="store_true", help="Reclassify samples with existing summaries")
+    args = parser.parse_args()
+
+    sys.exit(main(args))
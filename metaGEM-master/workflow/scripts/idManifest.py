@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Cached manifest of the sample, bin, and GEM IDs used to expand Snakefile wildcards.
+The IDs found in each folder are stored in a small JSON file in the project root together with the folder's mtime,
+so that a folder is only listed again when its contents have changed. Imported by the Snakefile at startup,
+and can also be run directly to inspect or rebuild the manifest.
+"""
+from __future__ import print_function
+import os
+import json
+import time
+import argparse
+
+MANIFEST = ".metaGEM_manifest.json"
+VERSION = 1
+
+# A folder modified this close to the time it was last listed may have changed within the same mtime tick,
+# so its cached IDs are not trusted (same approach as git's racy index entries)
+RACY_NS = 2 * 10**9
+
+class Manifest(object):
+
+    def __init__(self, root, filename=MANIFEST):
+        self.root = root
+        self.path = os.path.join(root, filename)
+        self.folders = {}
+        self.changed = False
+        try:
+            with open(self.path) as manifest:
+                data = json.load(manifest)
+            if data.get("version") == VERSION:
+                self.folders = data["folders"]
+        except (OSError, ValueError, KeyError):
+            self.folders = {}
+
+    def ids(self, folder, extension=None):
+        """Return sorted IDs of the non-hidden entries in folder (optionally only *extension files), as glob would."""
+        key = "{}|{}".format(folder, extension or "*")
+        path = os.path.join(self.root, folder)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            # Missing folder, e.g. a later stage that has not run yet
+            if key in self.folders:
+                del self.folders[key]
+                self.changed = True
+            return []
+
+        cached = self.folders.get(key)
+        if cached and cached["mtime_ns"] == mtime and cached["scanned_ns"] - mtime > RACY_NS:
+            return cached["ids"]
+
+        scanned = time.time_ns()
+        ids = sorted(scan(path, extension))
+        self.folders[key] = {"mtime_ns": mtime, "scanned_ns": scanned, "ids": ids}
+        self.changed = True
+        return ids
+
+    def save(self):
+        if not self.changed:
+            return
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        try:
+            with open(tmp_path, "w") as manifest:
+                json.dump({"version": VERSION, "folders": self.folders}, manifest)
+            os.replace(tmp_path, self.path)
+            self.changed = False
+        except OSError:
+            # Read-only or missing project root: the manifest is only a cache, so carry on without it
+            pass
+
+def scan(path, extension=None):
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if extension and not entry.name.endswith(extension):
+                continue
+            yield os.path.splitext(entry.name)[0]
+
+def main(args):
+    if args.rebuild and os.path.exists(os.path.join(args.root, MANIFEST)):
+        os.remove(os.path.join(args.root, MANIFEST))
+    manifest = Manifest(args.root)
+    for folder in args.folders:
+        folder, _, extension = folder.partition(":")
+        ids = manifest.ids(folder, extension or None)
+        print("{}\t{}\t{}".format(folder, extension or "*", len(ids)))
+    manifest.save()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("root", help="Project root folder, i.e. config.yaml path:root")
+    parser.add_argument("folders", nargs='*', default=["dataset", "protein_bins:.faa", "GEMs:.xml", "pangenome/speciesBinIDs:.txt"],
+                        help="Folders to list, optionally with an extension filter as FOLDER:EXTENSION")
+    parser.add_argument("--rebuild", action="store_true", help="Discard the cached manifest and list all folders again")
+    args = parser.parse_args()
+
+    main(args)
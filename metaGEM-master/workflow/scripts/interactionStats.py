@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Summarizes SMETANA detailed outputs across samples in a single pass over the *_detailed.tsv files.
+Writes a sample x medium interaction count matrix (sampleMedia.stats) and per receiver/donor pair
+metabolite exchange scores for each sample and medium (interactions.stats).
+"""
+from __future__ import print_function
+import sys
+import os
+import glob
+import argparse
+import pandas as pd
+
+SUFFIX = "_detailed.tsv"
+COLUMNS = ["medium", "receiver", "donor", "compound", "smetana"]
+PAIR_COLUMNS = ["sample", "medium", "receiver", "donor", "compounds", "smetana_sum", "smetana_mean", "smetana_max"]
+
+def sample_from_path(path):
+    return os.path.basename(path)[:-len(SUFFIX)]
+
+def main(args):
+    counts = []
+    pairs = []
+    files = sorted(glob.glob(os.path.join(args.smetana_directory, "*" + SUFFIX)))
+    if not files:
+        sys.stderr.write("No SMETANA results found in {}\n".format(args.smetana_directory))
+        return 1
+    samples = [sample_from_path(path) for path in files]
+    for sample, path in zip(samples, files):
+        # Each file is read exactly once and reduced before moving on, so memory stays bounded by the largest sample
+        try:
+            df = pd.read_table(path, usecols=COLUMNS)
+        except pd.errors.EmptyDataError:
+            df = pd.DataFrame(columns=COLUMNS)
+        sys.stderr.write("Read {} interactions from sample {}\n".format(len(df), sample))
+        if df.empty:
+            continue
+        df["sample"] = sample
+
+        counts.append(df.groupby(["sample", "medium"]).size())
+        pairs.append(df.groupby(["sample", "medium", "receiver", "donor"]).agg(
+            compounds=("compound", "nunique"),
+            smetana_sum=("smetana", "sum"),
+            smetana_mean=("smetana", "mean"),
+            smetana_max=("smetana", "max")))
+
+    # Samples without any interaction in a medium, or without any interaction at all, are reported as 0,
+    # as in the original sampleMedia.stats
+    if counts:
+        matrix = pd.concat(counts).unstack(fill_value=0).sort_index(axis=1)
+        pairs = pd.concat(pairs).reset_index()
+    else:
+        matrix = pd.DataFrame(index=pd.Index([], name="sample"))
+        pairs = pd.DataFrame(columns=PAIR_COLUMNS)
+    matrix = matrix.reindex(samples, fill_value=0)
+    matrix.to_csv(args.sample_media, sep=" ", header=args.header, index=True, index_label="sample")
+    pairs.to_csv(args.pairs, sep="\t", index=False, float_format="%.6f")
+
+    sys.stderr.write("\nSummarized {} samples across {} media\n\n".format(matrix.shape[0], matrix.shape[1]))
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("smetana_directory", help="Folder containing SMETANA SAMPLE_detailed.tsv files")
+    parser.add_argument("sample_media", help="Output sample x medium interaction count matrix")
+    parser.add_argument("pairs", help="Output table of per pair metabolite exchange scores")
+    parser.add_argument("--header", action="store_true", help="Write a header line to the count matrix, omitted by default for compatibility")
+    args = parser.parse_args()
+
+    sys.exit(main(args))
@@ -6,6 +6,8 @@ import pandas as pd
 import os
 import sys
 
+from codec import open_file
+
 def samplenames_from_file(name_file):
     if name_file:
         with open(name_file, 'r') as name_file_h:
@@ -22,13 +24,19 @@ def main(args):
             samplename = samplenames[i]
         else:
             samplename = os.path.basename(sample)        
-        sample_df = pd.read_table(sample, index_col=0)
+        # Abundance files may be gzip or zstd compressed, depending on config.yaml compression:codec
+        with open_file(sample, "rt") as quantfile:
+            sample_df = pd.read_table(quantfile, index_col=0)
         
         sample_dfs.append((samplename, sample_df))
     kallisto_df = pd.DataFrame(index=sample_df.index)
 
     for sample, sample_df in sample_dfs:
         kallisto_df['kallisto_coverage_{0}'.format(sample)] = 200*sample_df['est_counts'].divide(sample_df['length'])
+    if args.all_samples:
+        # Samples that were not mapped against this assembly (see crossMapPartners.py) get zero coverage
+        columns = ['kallisto_coverage_{0}'.format(sample) for sample in args.all_samples]
+        kallisto_df = kallisto_df.reindex(columns=columns, fill_value=0.0)
     kallisto_df.to_csv(sys.stdout, sep="\t", float_format="%.6f")
 
 
@@ -36,6 +44,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument("quantfiles", nargs='+', help="Kallisto abundance.txt files")
     parser.add_argument("--samplenames", default=None, help="File with sample names, one line each, Should be the same order and the same number as the abundance.txt files")
+    parser.add_argument("--all_samples", nargs='+', default=None, help="All sample names, one output column each in this order, with zeros for samples without an abundance file")
     args = parser.parse_args()
     
     main(args)
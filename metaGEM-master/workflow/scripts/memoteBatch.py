@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Runs the memote test suite once per GEM and writes both the HTML snapshot report and the result.json.gz from that single run.
+Models are loaded and tested inside a persistent pool of worker processes, so a whole directory of GEMs can be processed in one job.
+Output files are written to OUTPUT_DIRECTORY/GEMID/GEMID.html and OUTPUT_DIRECTORY/GEMID/GEMID.json.gz, matching the memote rule.
+"""
+from __future__ import print_function
+import sys
+import os
+import glob
+import time
+import argparse
+import multiprocessing
+
+import memote
+from memote.suite.results import ResultManager
+
+# Tests that take hours on large community-derived GEMs, skipped by default as in the original memote rule
+DEFAULT_SKIP = ",".join([
+    "test_find_metabolites_produced_with_closed_bounds",
+    "test_find_metabolites_consumed_with_closed_bounds",
+    "test_find_metabolites_not_produced_with_open_bounds",
+    "test_find_metabolites_not_consumed_with_open_bounds",
+    "test_find_incorrect_thermodynamic_reversibility"])
+
+def gem_id(model_path):
+    return os.path.basename(model_path).replace(".xml", "")
+
+def output_paths(output_directory, model_path):
+    gem = gem_id(model_path)
+    folder = os.path.join(output_directory, gem)
+    return folder, os.path.join(folder, gem + ".html"), os.path.join(folder, gem + ".json.gz")
+
+def collect_models(paths):
+    # Accept any mix of model files and directories containing *.xml models
+    models = []
+    for path in paths:
+        if os.path.isdir(path):
+            models.extend(glob.glob(os.path.join(path, "*.xml")))
+        else:
+            models.append(path)
+    return sorted(models)
+
+def run_model(task):
+    model_path, output_directory, skip, solver_timeout, overwrite = task
+    gem = gem_id(model_path)
+    folder, html_path, json_path = output_paths(output_directory, model_path)
+    if not overwrite and os.path.exists(html_path) and os.path.exists(json_path):
+        return gem, "skipped", 0.0
+
+    start = time.time()
+    try:
+        # Load and validate the SBML file once, then reuse the same result for both outputs
+        model, sbml_ver, notifications = memote.validate_model(model_path)
+        if model is None:
+            sys.stderr.write("Model {} failed SBML validation: {}\n".format(gem, notifications["errors"]))
+            return gem, "invalid", time.time() - start
+        code, result = memote.test_model(model, sbml_version=sbml_ver, results=True,
+                                         skip=skip, solver_timeout=solver_timeout)
+        report = memote.snapshot_report(result, html=True)
+
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        with open(html_path, "w", encoding="utf-8") as html_file:
+            html_file.write(report)
+        ResultManager().store(result, filename=json_path)
+    except Exception as error:
+        sys.stderr.write("Error testing model {}: {}\n".format(gem, error))
+        return gem, "failed", time.time() - start
+
+    return gem, "done", time.time() - start
+
+def main(args):
+    models = collect_models(args.models)
+    skip = [test for test in args.skip.split(",") if test]
+    tasks = [(model, args.output_directory, skip, args.solver_timeout, args.overwrite) for model in models]
+    sys.stderr.write("Testing {} models with {} worker processes ... \n".format(len(tasks), args.processes))
+
+    # maxtasksperchild lets long-running pools recycle workers if memory creeps up across pytest sessions
+    pool = multiprocessing.Pool(args.processes, maxtasksperchild=args.max_tasks_per_child or None)
+    failed = 0
+    summary = open(args.summary, "w") if args.summary else sys.stdout
+    summary.write("gemID\tstatus\tseconds\n")
+    for gem, status, seconds in pool.imap_unordered(run_model, tasks):
+        sys.stderr.write("Model {} {} in {:.1f} s\n".format(gem, status, seconds))
+        summary.write("{}\t{}\t{:.1f}\n".format(gem, status, seconds))
+        summary.flush()
+        if status in ("failed", "invalid"):
+            failed += 1
+    pool.close()
+    pool.join()
+    if summary is not sys.stdout:
+        summary.close()
+
+    sys.stderr.write("\nDone testing {} models, {} failed\n\n".format(len(tasks), failed))
+    return 1 if failed and args.strict else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("models", nargs='+', help="GEM .xml files or directories containing GEM .xml files")
+    parser.add_argument("--output_directory", required=True, help="Directory where per-model report folders are written")
+    parser.add_argument("--processes", default=1, type=int, help="Number of worker processes, default=1")
+    parser.add_argument("--skip", default=DEFAULT_SKIP, help="Comma separated list of memote tests to skip")
+    parser.add_argument("--solver_timeout", default=10, type=int, help="Solver timeout in seconds, default=10")
+    parser.add_argument("--max_tasks_per_child", default=0, type=int, help="Recycle workers after this many models, default=0 (never)")
+    parser.add_argument("--summary", default=None, help="Write the per-model status table here instead of stdout")
+    parser.add_argument("--overwrite", action="store_true", help="Re-test models that already have both reports")
+    parser.add_argument("--strict", action="store_true", help="Exit with non-zero status if any model fails")
+    args = parser.parse_args()
+
+    sys.exit(main(args))
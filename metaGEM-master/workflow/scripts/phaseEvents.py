@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""
+Structured timing events for the phases of a rule's shell block (copy, index, map, sort, summarize, move, ...),
+so that the time spent staging data can be told apart from compute without parsing the free text SLURM logs.
+shell:   prints the definition of a phase shell function for one job, to be evaluated at the top of a shell block:
+             eval "$(python phaseEvents.py shell EVENTS_DIRECTORY --rule RULE --job JOB)"
+             phase index -- bwa index $id.fa
+             phase map --bytes $id.bam -- eval "bwa mem ... | samtools sort -o $id.bam -"
+         The function runs the command in the current shell, then records it with emit and returns its exit code.
+emit:    appends one JSON-lines event with the start and end times, exit code, and the size of the --bytes paths to
+         EVENTS_DIRECTORY/RULE.JOB.jsonl.
+collect: builds per rule and phase latency distributions from the event files of all jobs, and the share of the total
+         time spent in staging phases (--staging) versus compute.
+"""
+from __future__ import print_function
+import sys
+import os
+import glob
+import json
+import socket
+import argparse
+
+STAGING = "copy,stage,move,decompress,compress"
+
+FUNCTION = """phase() {{
+    # phase NAME [--bytes PATH ...] -- COMMAND [ARGS ...]
+    local name=$1 code=0 start
+    local -a paths=()
+    shift
+    if [ "${{1:-}}" == "--bytes" ]; then
+        shift
+        while [ $# -gt 0 ] && [ "$1" != "--" ]; do paths+=("$1"); shift; done
+    fi
+    if [ "${{1:-}}" == "--" ]; then shift; fi
+    start=$(date +%s.%N)
+    "$@" || code=$?
+    python {script} emit {events} --rule {rule} --job {job} --phase "$name" --start $start --end $(date +%s.%N) --code $code ${{paths[@]+--bytes "${{paths[@]}}"}} >&2 || true
+    return $code
+}}
+"""
+
+def size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for folder, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(folder, name))
+            except OSError:
+                continue
+    return total
+
+def events_file(directory, rule, job):
+    return os.path.join(directory, "{}.{}.jsonl".format(rule, job))
+
+def shell(args):
+    directory = os.path.abspath(args.events_directory)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    print(FUNCTION.format(script=os.path.abspath(__file__), events=directory, rule=args.rule, job=args.job))
+    return 0
+
+def emit(args):
+    event = {"rule": args.rule, "job": args.job, "phase": args.phase, "start": args.start, "end": args.end,
+             "seconds": round(args.end - args.start, 3), "code": args.code,
+             "bytes": sum(size(path) for path in args.bytes or []), "host": socket.gethostname()}
+    # A single O_APPEND write per event, so events of concurrent phases are never interleaved
+    line = (json.dumps(event, sort_keys=True) + "\n").encode()
+    descriptor = os.open(events_file(args.events_directory, args.rule, args.job), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(descriptor, line)
+    finally:
+        os.close(descriptor)
+    return 0
+
+def read_events(patterns):
+    paths = sorted(set(path for pattern in patterns for path in glob.glob(os.path.join(pattern, "*.jsonl") if os.path.isdir(pattern) else pattern)))
+    for path in paths:
+        with open(path) as events:
+            for line in events:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A job killed while writing leaves a partial last line
+                    continue
+
+def percentile(values, fraction):
+    # Nearest-rank percentile of sorted values
+    index = max(int(round(fraction * len(values) + 0.5)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+def collect(args):
+    staging = set(args.staging.split(","))
+    phases = {}
+    for event in read_events(args.events):
+        phase = phases.setdefault((event["rule"], event["phase"]), {"seconds": [], "failed": 0, "bytes": 0, "jobs": set()})
+        phase["seconds"].append(float(event["seconds"]))
+        phase["failed"] += event["code"] != 0
+        phase["bytes"] += event.get("bytes", 0)
+        phase["jobs"].add(event["job"])
+    if not phases:
+        sys.stderr.write("No phase events found in {}\n".format(", ".join(args.events)))
+        return 1
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    output.write("rule\tphase\tcategory\tjobs\tevents\tfailed\ttotal_s\tmean_s\tp50_s\tp90_s\tp99_s\tmax_s\tgigabytes\tmb_per_s\n")
+    categories = {}
+    for (rule, name), phase in sorted(phases.items()):
+        seconds = sorted(phase["seconds"])
+        total = sum(seconds)
+        category = "staging" if name in staging else "compute"
+        categories[category] = categories.get(category, 0.0) + total
+        output.write("{}\t{}\t{}\t{}\t{}\t{}\t{:.1f}\t{:.2f}\t{:.2f}\t{:.2f}\t{:.2f}\t{:.2f}\t{:.3f}\t{:.1f}\n".format(
+            rule, name, category, len(phase["jobs"]), len(seconds), phase["failed"], total, total / len(seconds),
+            percentile(seconds, 0.5), percentile(seconds, 0.9), percentile(seconds, 0.99), seconds[-1],
+            phase["bytes"] / 1e9, phase["bytes"] / 1e6 / total if total else 0.0))
+    if args.output:
+        output.close()
+
+    overall = sum(categories.values())
+    for category in sorted(categories):
+        sys.stderr.write("{}: {:.1f} h, {:.1%} of the recorded phase time\n".format(
+            category, categories[category] / 3600.0, categories[category] / overall if overall else 0.0))
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command")
+
+    shell_parser = subparsers.add_parser("shell", help="Print the phase shell function of a job")
+    shell_parser.add_argument("events_directory", help="Folder of the event files, e.g. logs/events")
+    shell_parser.add_argument("--rule", required=True)
+    shell_parser.add_argument("--job", required=True, help="Job name, e.g. the sample ID")
+
+    emit_parser = subparsers.add_parser("emit", help="Append a phase event")
+    emit_parser.add_argument("events_directory")
+    emit_parser.add_argument("--rule", required=True)
+    emit_parser.add_argument("--job", required=True)
+    emit_parser.add_argument("--phase", required=True)
+    emit_parser.add_argument("--start", required=True, type=float, help="Epoch seconds")
+    emit_parser.add_argument("--end", required=True, type=float, help="Epoch seconds")
+    emit_parser.add_argument("--code", default=0, type=int, help="Exit code of the phase, default=0")
+    emit_parser.add_argument("--bytes", nargs='*', default=None, help="Files or folders whose total size is recorded")
+
+    collect_parser = subparsers.add_parser("collect", help="Per rule and phase latency distributions across jobs")
+    collect_parser.add_argument("events", nargs='+', help="Event folders, files, or glob patterns")
+    collect_parser.add_argument("--staging", default=STAGING, help="Phases counted as data staging, default=" + STAGING)
+    collect_parser.add_argument("--output", default=None, help="Write the table here instead of stdout")
+
+    args = parser.parse_args()
+    commands = {"shell": shell, "emit": emit, "collect": collect}
+    if args.command not in commands:
+        parser.print_help()
+        sys.exit(1)
+    sys.exit(commands[args.command](args))
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""
+Subsampled preview runs for tuning parameters end-to-end on a fraction of the data before committing to a full run.
+subsample: streams a pair of qfiltered fastq.gz files and keeps a seeded random subset of read pairs, either a fraction
+           of the pairs or an exact number of pairs (selection sampling over a counting pass), so the output is the
+           same for the same seed and the R1/R2 files stay in sync. Called by the previewReads rule.
+report:    compares the preview runs found in a preview root, one row per run and bin tool, with bin counts and CheckM
+           quality read from each run's bin database, next to the config values that differ between the runs.
+prepare_root() is used by the Snakefile to set up the project root of a preview run, PREVIEW_ROOT/NAME, with links to
+the shared subsampled reads and the scripts folder of the main project.
+"""
+from __future__ import print_function
+import sys
+import os
+import gzip
+import json
+import random
+import sqlite3
+import argparse
+import subprocess
+
+from codec import open_file, compress_command
+
+CONFIG = "preview_config.json"
+# Config sections that differ between runs without changing results
+IGNORED = ("path", "task", "previewName", "envs", "scratchManager", "staging")
+HIGH_QUALITY = (90, 5)
+MEDIUM_QUALITY = (50, 10)
+
+def link(target, path):
+    if os.path.islink(path) and os.readlink(path) == target:
+        return
+    if os.path.islink(path):
+        os.remove(path)
+    os.symlink(target, path)
+
+def prepare_root(root, preview_root, name, config):
+    """Creates the project root of preview run NAME and returns its path."""
+    run_root = os.path.join(preview_root, name)
+    if not os.path.exists(run_root):
+        os.makedirs(run_root)
+    folders = config["folder"]
+    link(os.path.join(os.path.abspath(root), folders["scripts"]), os.path.join(run_root, folders["scripts"]))
+    link(os.path.join("..", folders["qfiltered"]), os.path.join(run_root, folders["qfiltered"]))
+
+    # Kept with the run so that the report can tell which parameters each preview was made with
+    settings = dict((key, value) for key, value in config.items() if key not in IGNORED)
+    path = os.path.join(run_root, CONFIG)
+    try:
+        with open(path) as existing:
+            if json.load(existing) == settings:
+                return run_root
+    except (IOError, ValueError):
+        pass
+    with open(path + ".tmp", "w") as output:
+        json.dump(settings, output, indent=1, sort_keys=True)
+    os.rename(path + ".tmp", path)
+    return run_root
+
+def records(handle):
+    while True:
+        record = [handle.readline() for _ in range(4)]
+        if not record[0]:
+            return
+        yield record
+
+def count_records(path, threads):
+    with open_file(path, "rb", threads) as handle:
+        lines = sum(chunk.count(b"\n") for chunk in iter(lambda: handle.read(4 * 1024 * 1024), b""))
+    return lines // 4
+
+class GzipWriter(object):
+    """Writes a fastq.gz file through pigz when available, renamed into place on close."""
+
+    def __init__(self, path, level, threads):
+        self.path = path
+        self.output = open(path + ".tmp", "wb")
+        command = compress_command("pigz", level, threads)
+        if command:
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=self.output)
+            self.handle = self.process.stdin
+        else:
+            self.process = None
+            self.handle = gzip.GzipFile(filename="", fileobj=self.output, mode="wb", compresslevel=level, mtime=0)
+
+    def write(self, lines):
+        self.handle.writelines(lines)
+
+    def close(self):
+        self.handle.close()
+        if self.process and self.process.wait() != 0:
+            raise IOError("pigz failed writing {}".format(self.path))
+        self.output.close()
+        os.rename(self.path + ".tmp", self.path)
+
+def subsample(args):
+    # Seeded per sample, so samples get independent subsets that are reproduced by every rerun
+    sample = os.path.basename(args.input_r1).split("_R1")[0]
+    generator = random.Random("{}:{}".format(args.seed, sample))
+    total = count_records(args.input_r1, args.threads) if args.reads else None
+
+    kept = 0
+    seen = 0
+    writers = [GzipWriter(path, args.level, args.threads) for path in (args.output_r1, args.output_r2)]
+    with open_file(args.input_r1, "rb", args.threads) as r1, open_file(args.input_r2, "rb", args.threads) as r2:
+        for first, second in zip(records(r1), records(r2)):
+            if args.reads:
+                # Selection sampling: keeps exactly min(reads, total) pairs in a single pass over the records
+                selected = generator.random() * (total - seen) < args.reads - kept
+            else:
+                selected = generator.random() < args.fraction
+            if selected:
+                writers[0].write(first)
+                writers[1].write(second)
+                kept += 1
+            seen += 1
+    for writer in writers:
+        writer.close()
+    sys.stderr.write("Kept {} of {} read pairs of {} (seed {})\n".format(kept, total if total is not None else seen, sample, args.seed))
+    return 0
+
+def flatten(settings, prefix=""):
+    values = {}
+    for key, value in settings.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, prefix + key + "."))
+        else:
+            values[prefix + key] = value
+    return values
+
+def bin_quality(database):
+    rows = {}
+    db = sqlite3.connect(database)
+    query = ("SELECT tool, COUNT(*), COUNT(DISTINCT sample), AVG(completeness), AVG(contamination), "
+             "SUM(completeness >= ? AND contamination <= ?), SUM(completeness >= ? AND contamination <= ?), SUM(length) "
+             "FROM bins GROUP BY tool")
+    for row in db.execute(query, HIGH_QUALITY + MEDIUM_QUALITY):
+        rows[row[0]] = row[1:]
+    db.close()
+    return rows
+
+def report(args):
+    runs = {}
+    for name in sorted(os.listdir(args.preview_root)):
+        config = os.path.join(args.preview_root, name, CONFIG)
+        if os.path.isfile(config):
+            with open(config) as settings:
+                runs[name] = flatten(json.load(settings))
+    if not runs:
+        sys.stderr.write("No preview runs found in {}\n".format(args.preview_root))
+        return 1
+
+    keys = sorted(set(key for values in runs.values() for key in values))
+    differing = [key for key in keys if len(set(json.dumps(values.get(key)) for values in runs.values())) > 1]
+    columns = ["run", "tool", "bins", "samples", "mean_completeness", "mean_contamination", "high_quality", "medium_quality", "total_length"]
+    output = open(args.output, "w") if args.output else sys.stdout
+    output.write("\t".join(columns + differing) + "\n")
+    for name in sorted(runs):
+        database = os.path.join(args.preview_root, name, args.database)
+        if not os.path.isfile(database):
+            sys.stderr.write("Preview run {} has no bin database yet, skipping\n".format(name))
+            continue
+        settings = [str(runs[name].get(key, "")) for key in differing]
+        for tool, row in sorted(bin_quality(database).items()):
+            values = ["" if value is None else "{:.2f}".format(value) if isinstance(value, float) else str(value) for value in row]
+            output.write("\t".join([name, tool] + values + settings) + "\n")
+    if args.output:
+        output.close()
+        print(args.output)
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command")
+
+    subsample_parser = subparsers.add_parser("subsample", help="Keep a seeded random subset of the read pairs of a sample")
+    subsample_parser.add_argument("input_r1")
+    subsample_parser.add_argument("input_r2")
+    subsample_parser.add_argument("output_r1")
+    subsample_parser.add_argument("output_r2")
+    subsample_parser.add_argument("--fraction", default=0.1, type=float, help="Fraction of read pairs kept, default=0.1")
+    subsample_parser.add_argument("--reads", default=0, type=int, help="Exact number of read pairs kept instead of a fraction, default=0 (off)")
+    subsample_parser.add_argument("--seed", default=100, type=int, help="default=100")
+    subsample_parser.add_argument("--level", default=6, type=int, help="gzip compression level, default=6")
+    subsample_parser.add_argument("--threads", default=2, type=int, help="default=2")
+
+    report_parser = subparsers.add_parser("report", help="Compare the bins of the preview runs in a preview root")
+    report_parser.add_argument("preview_root", help="Folder holding one project root per preview run, e.g. preview")
+    report_parser.add_argument("--database", default=os.path.join("stats", "bins.sqlite"), help="Bin database path within each run, default=stats/bins.sqlite")
+    report_parser.add_argument("--output", default=None, help="Write the report to this file instead of stdout")
+
+    args = parser.parse_args()
+    commands = {"subsample": subsample, "report": report}
+    if args.command not in commands:
+        parser.print_help()
+        sys.exit(1)
+    sys.exit(commands[args.command](args))
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+"""
+Samples the resource use of a job's whole process tree over time, to show which phase of a long rule (e.g. bwa,
+samtools sort, or jgi_summarize_bam_contig_depths in crossMapSeries) is the bottleneck and when memory peaks,
+which the single max_rss/cpu_time line of a Snakemake benchmark file cannot.
+record: started in the background at the top of a rule's shell block with the shell's PID ($$). Every INTERVAL
+        seconds it reads /proc for all descendants of that PID and appends a line to a timeline file with the
+        CPU use (100 = one core), total RSS, bytes read and written since the last line, number of processes,
+        and the commands that were active, e.g. bwa:2310,samtools:95. Stops by itself when the job's shell exits.
+render: combines the timeline files of several jobs (SAMPLE.RULE.timeline.tsv) into a per-phase breakdown,
+        where each line of a timeline is assigned to the command using the most CPU at that time.
+"""
+from __future__ import print_function
+import sys
+import os
+import re
+import glob
+import time
+import argparse
+
+# Also runs under the python 2 metawrap environment used by binRefine and binReassemble
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_MB = os.sysconf("SC_PAGE_SIZE") / (1024.0 * 1024.0)
+MB = 1024.0 * 1024.0
+HEADER = ["time", "cpu", "rss_mb", "read_mb", "write_mb", "processes", "active"]
+# Wrapper processes that never do the work themselves
+SHELLS = ("bash", "sh", "dash", "time", "timeout", "xargs", "env")
+IDLE = "idle"
+
+def read_stat(pid):
+    # Fields after the command name, which is in parentheses and may itself contain spaces or parentheses
+    with open("/proc/{}/stat".format(pid)) as stat:
+        data = stat.read()
+    name = data[data.index("(") + 1:data.rindex(")")]
+    fields = data[data.rindex(")") + 2:].split()
+    return {"name": name, "ppid": int(fields[1]), "cpu": int(fields[11]) + int(fields[12]),
+            "children_cpu": int(fields[13]) + int(fields[14]), "start": int(fields[19]), "rss": int(fields[21])}
+
+def read_io(pid):
+    counters = {}
+    try:
+        with open("/proc/{}/io".format(pid)) as io:
+            for line in io:
+                key, value = line.split(":")
+                counters[key] = int(value)
+    except (IOError, OSError, ValueError):
+        return 0, 0
+    return counters.get("read_bytes", 0), counters.get("write_bytes", 0)
+
+def process_tree(root, skip):
+    stats = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit() and int(entry) != skip:
+            try:
+                stats[int(entry)] = read_stat(entry)
+            except (IOError, OSError, ValueError):
+                continue
+    children = {}
+    for pid, stat in stats.items():
+        children.setdefault(stat["ppid"], []).append(pid)
+    tree = {}
+    pending = [root]
+    while pending:
+        pid = pending.pop()
+        if pid in stats:
+            tree[pid] = stats[pid]
+            pending.extend(children.get(pid, []))
+    return tree
+
+def record(args):
+    try:
+        root_start = read_stat(args.pid)["start"]
+    except (IOError, OSError):
+        sys.stderr.write("Process {} not found\n".format(args.pid))
+        return 1
+    folder = os.path.dirname(os.path.abspath(args.timeline))
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    started = time.time()
+    previous = {}
+    previous_total = None
+    previous_time = started
+    with open(args.timeline, "w") as timeline:
+        timeline.write("\t".join(HEADER) + "\n")
+        while True:
+            tree = process_tree(args.pid, os.getpid())
+            # A reused PID is not the job anymore
+            if args.pid not in tree or tree[args.pid]["start"] != root_start:
+                break
+            now = time.time()
+            elapsed = max(now - previous_time, 1e-6)
+            # Live processes plus the children they have already waited for, so short lived commands are counted
+            total = sum(stat["cpu"] + stat["children_cpu"] for stat in tree.values())
+            current = {}
+            active = {}
+            read_bytes = write_bytes = 0
+            for pid, stat in tree.items():
+                reads, writes = read_io(pid)
+                key = (pid, stat["start"])
+                # Processes started since the last line count from zero, the first line only sets the baseline
+                before = previous.get(key, (0, 0, 0)) if previous_total is not None else (stat["cpu"], reads, writes)
+                current[key] = (stat["cpu"], reads, writes)
+                read_bytes += max(reads - before[1], 0)
+                write_bytes += max(writes - before[2], 0)
+                used = 100.0 * (stat["cpu"] - before[0]) / CLOCK_TICKS / elapsed
+                if stat["name"] not in SHELLS:
+                    active[stat["name"]] = active.get(stat["name"], 0.0) + used
+            cpu = 0.0 if previous_total is None else 100.0 * (total - previous_total) / CLOCK_TICKS / elapsed
+            busy = sorted(((used, name) for name, used in active.items() if used >= args.min_cpu), reverse=True)
+            if busy:
+                commands = ",".join("{}:{:.0f}".format(name, used) for used, name in busy)
+            else:
+                commands = ",".join(sorted(active)) or IDLE
+            timeline.write("{:.1f}\t{:.0f}\t{:.1f}\t{:.1f}\t{:.1f}\t{}\t{}\n".format(
+                now - started, max(cpu, 0.0), sum(stat["rss"] for stat in tree.values()) * PAGE_MB,
+                read_bytes / MB, write_bytes / MB, len(tree), commands))
+            timeline.flush()
+            previous, previous_total, previous_time = current, total, now
+            time.sleep(args.interval)
+    return 0
+
+def job_name(path):
+    # SAMPLE.RULE.timeline.tsv, named after the SAMPLE.RULE.benchmark.txt file of the job
+    parts = os.path.basename(path).split(".")
+    return ".".join(parts[:-3]), parts[-3]
+
+def phase_of(active):
+    # The command with the most CPU, or the first listed command when none was busy
+    first = active.split(",")[0]
+    return re.sub(r":[0-9]+$", "", first) or IDLE
+
+def read_timeline(path):
+    rows = []
+    with open(path) as timeline:
+        header = timeline.readline().rstrip("\n").split("\t")
+        for line in timeline:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) == len(header):
+                rows.append(dict(zip(header, fields)))
+    return rows
+
+def summarize(path):
+    # Seconds, CPU seconds, peak RSS, and MB read and written by each phase of one job
+    phases = {}
+    previous_time = 0.0
+    for row in read_timeline(path):
+        now = float(row["time"])
+        duration = now - previous_time
+        previous_time = now
+        phase = phases.setdefault(phase_of(row["active"]), {"seconds": 0.0, "cpu_seconds": 0.0, "rss_mb": 0.0, "read_mb": 0.0, "write_mb": 0.0})
+        phase["seconds"] += duration
+        phase["cpu_seconds"] += duration * float(row["cpu"]) / 100.0
+        phase["rss_mb"] = max(phase["rss_mb"], float(row["rss_mb"]))
+        phase["read_mb"] += float(row["read_mb"])
+        phase["write_mb"] += float(row["write_mb"])
+    return phases, previous_time
+
+def render(args):
+    paths = sorted(path for pattern in args.timelines for path in glob.glob(pattern))
+    if not paths:
+        sys.stderr.write("No timeline files found\n")
+        return 1
+    output = open(args.output, "w") if args.output else sys.stdout
+    if args.per_job:
+        output.write("rule\tjob\tphase\tseconds\tfraction\tmean_cpu\tpeak_rss_mb\tread_mb\twrite_mb\n")
+    else:
+        output.write("rule\tphase\tjobs\tseconds\tfraction\tmean_cpu\tpeak_rss_mb\tread_mb\twrite_mb\n")
+
+    totals = {}
+    for path in paths:
+        job, rule = job_name(path)
+        phases, duration = summarize(path)
+        for phase, values in sorted(phases.items(), key=lambda item: -item[1]["seconds"]):
+            if args.per_job:
+                output.write("{}\t{}\t{}\t{:.0f}\t{:.3f}\t{:.0f}\t{:.0f}\t{:.0f}\t{:.0f}\n".format(
+                    rule, job, phase, values["seconds"], values["seconds"] / max(duration, 1e-6),
+                    100.0 * values["cpu_seconds"] / max(values["seconds"], 1e-6), values["rss_mb"], values["read_mb"], values["write_mb"]))
+            total = totals.setdefault((rule, phase), {"jobs": 0, "seconds": 0.0, "cpu_seconds": 0.0, "rss_mb": 0.0, "read_mb": 0.0, "write_mb": 0.0})
+            total["jobs"] += 1
+            for key in ("seconds", "cpu_seconds", "read_mb", "write_mb"):
+                total[key] += values[key]
+            total["rss_mb"] = max(total["rss_mb"], values["rss_mb"])
+        totals.setdefault((rule, None), {"seconds": 0.0})["seconds"] += duration
+
+    if not args.per_job:
+        for (rule, phase), values in sorted(totals.items(), key=lambda item: (item[0][0], -item[1]["seconds"])):
+            if phase is None:
+                continue
+            output.write("{}\t{}\t{}\t{:.0f}\t{:.3f}\t{:.0f}\t{:.0f}\t{:.0f}\t{:.0f}\n".format(
+                rule, phase, values["jobs"], values["seconds"], values["seconds"] / max(totals[(rule, None)]["seconds"], 1e-6),
+                100.0 * values["cpu_seconds"] / max(values["seconds"], 1e-6), values["rss_mb"],
+                values["read_mb"], values["write_mb"]))
+    if args.output:
+        output.close()
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command")
+
+    record_parser = subparsers.add_parser("record", help="Write the timeline of a process tree until its root exits")
+    record_parser.add_argument("pid", type=int, help="Root of the process tree, e.g. $$ in a rule's shell block")
+    record_parser.add_argument("timeline", help="Timeline file, e.g. benchmarks/SAMPLE.RULE.timeline.tsv")
+    record_parser.add_argument("--interval", default=2.0, type=float, help="Seconds between samples, default=2")
+    record_parser.add_argument("--min_cpu", default=5.0, type=float, help="CPU percent for a command to be listed as active, default=5")
+
+    render_parser = subparsers.add_parser("render", help="Break down the time of each rule by phase across jobs")
+    render_parser.add_argument("timelines", nargs='+', help="Timeline files or glob patterns, e.g. 'benchmarks/*.crossMapSeries.timeline.tsv'")
+    render_parser.add_argument("--per_job", action="store_true", help="One row per job and phase instead of per rule and phase")
+    render_parser.add_argument("--output", default=None, help="Write the breakdown here instead of stdout")
+
+    args = parser.parse_args()
+    commands = {"record": record, "render": render}
+    if args.command not in commands:
+        parser.print_help()
+        sys.exit(1)
+    sys.exit(commands[args.command](args))
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+"""
+Progress of a metaGEM project, used by the stats task of metaGEM.sh.
+Each stage is checked for every sample of the dataset folder against the outputs of its Snakefile rule, e.g.
+qfiltered/SAMPLE/SAMPLE_R1.fastq.gz, assemblies/SAMPLE/contigs.fasta.gz, or SMETANA/SAMPLE_detailed.tsv.
+The stage folders and the sample subfolders within them are listed in one pass by a pool of threads, and the
+listing of each folder is cached in a small JSON file in the project root together with the folder's mtime,
+so that on later calls only folders whose contents have changed are listed again (one stat call for the others).
+Prints the number of samples done per stage, and optionally the stages done per sample (--samples), a JSON
+document for dashboards (--json), or a summary refreshed every few seconds (--watch).
+"""
+from __future__ import print_function
+import sys
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+CACHE = ".metaGEM_status.json"
+VERSION = 1
+
+# Same racy mtime rule as the ID manifest (idManifest.py)
+RACY_NS = 2 * 10**9
+
+FOLDERS = {"data": "dataset", "qfiltered": "qfiltered", "assemblies": "assemblies", "concoct": "concoct",
+           "maxbin": "maxbin", "metabat": "metabat", "refined": "refined_bins", "reassembled": "reassembled_bins",
+           "classification": "GTDBTk", "abundance": "abundance", "GEMs": "GEMs", "memote": "memote",
+           "SMETANA": "SMETANA"}
+
+# Stage name, config folder key, and the entries of FOLDER/SAMPLE that mark a sample as done. None means that the
+# sample subfolder itself is the output (directory outputs), templates are filled in with the sample ID
+STAGES = [
+    ("qfilter", "qfiltered", ["{}_R1.fastq.gz", "{}_R2.fastq.gz"]),
+    ("assembly", "assemblies", ["contigs.fasta.gz"]),
+    ("crossMap", "concoct", ["cov"]),
+    ("concoct", "concoct", ["{}.concoct-bins"]),
+    ("maxbin", "maxbin", ["{}.maxbin-bins"]),
+    ("metabat", "metabat", ["{}.metabat-bins"]),
+    ("binRefine", "refined", None),
+    ("binReassemble", "reassembled", None),
+    ("taxonomy", "classification", None),
+    ("abundance", "abundance", None),
+]
+
+def read_folders(path):
+    """Folder names of the folder section of config.yaml, parsed line by line like metaGEM.sh does."""
+    folders = dict(FOLDERS)
+    try:
+        with open(path) as config:
+            section = None
+            for line in config:
+                if line.strip() and not line[0].isspace():
+                    section = line.split(":")[0]
+                elif section == "folder" and ":" in line:
+                    key, value = line.split(":", 1)
+                    folders[key.strip()] = value.strip()
+    except IOError:
+        sys.stderr.write("No config file {}, using the default folder names\n".format(path))
+    return folders
+
+class Listings(object):
+    """Cached names of the non-hidden entries of folders, keyed by path relative to the project root."""
+
+    def __init__(self, root, threads):
+        self.root = root
+        self.path = os.path.join(root, CACHE)
+        self.threads = threads
+        self.folders = {}
+        self.listed = 0
+        try:
+            with open(self.path) as cache:
+                data = json.load(cache)
+            if data.get("version") == VERSION:
+                self.folders = data["folders"]
+        except (IOError, OSError, ValueError, KeyError):
+            self.folders = {}
+
+    def list(self, folder):
+        try:
+            mtime = os.stat(os.path.join(self.root, folder)).st_mtime_ns
+        except OSError:
+            return folder, None
+        cached = self.folders.get(folder)
+        if cached and cached["mtime_ns"] == mtime and cached["scanned_ns"] - mtime > RACY_NS:
+            return folder, cached
+        scanned = time.time_ns()
+        with os.scandir(os.path.join(self.root, folder)) as entries:
+            names = sorted(entry.name for entry in entries if not entry.name.startswith("."))
+        return folder, {"mtime_ns": mtime, "scanned_ns": scanned, "names": names}
+
+    def names(self, folders):
+        """Lists folders in parallel, returns {folder: set of names}, None for missing folders."""
+        found = {}
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            for folder, entry in pool.map(self.list, folders):
+                if entry is None:
+                    self.folders.pop(folder, None)
+                    found[folder] = None
+                    continue
+                if self.folders.get(folder) is not entry:
+                    self.folders[folder] = entry
+                    self.listed += 1
+                found[folder] = set(entry["names"])
+        return found
+
+    def save(self, keep):
+        # Folders that were not asked for this time, e.g. of removed samples, are dropped
+        stale = [folder for folder in self.folders if folder not in keep]
+        for folder in stale:
+            del self.folders[folder]
+        if not self.listed and not stale:
+            return
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        try:
+            with open(tmp_path, "w") as cache:
+                json.dump({"version": VERSION, "folders": self.folders}, cache)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            # Read-only project root: the listings are only a cache
+            pass
+
+def gem_sample(name, samples):
+    # GEMs are named SAMPLE_BIN.xml, the longest matching sample ID wins when IDs share a prefix
+    best = None
+    for end in range(len(name)):
+        if name[end] == "_" and name[:end] in samples:
+            best = name[:end]
+    return best
+
+def status(args, folders):
+    start = time.time()
+    listings = Listings(args.root, args.threads)
+    data = folders["data"]
+    stage_folders = sorted(set(folders[key] for _, key, _ in STAGES) | set(folders[key] for key in ("GEMs", "memote", "SMETANA")))
+    top = listings.names([data] + stage_folders)
+    samples = sorted(top[data] or [])
+    sample_set = set(samples)
+
+    # Sample subfolders are only listed for stages whose outputs live inside them, and only if they exist
+    nested = sorted(set(os.path.join(folders[key], sample) for _, key, markers in STAGES if markers
+                        for sample in samples if sample in (top[folders[key]] or ())))
+    # GEMs are moved into sample subfolders by organizeGEMs
+    gem_dirs = [os.path.join(folders["GEMs"], sample) for sample in samples if sample in (top[folders["GEMs"]] or ())]
+    inner = listings.names(nested + gem_dirs)
+
+    per_sample = dict((sample, {}) for sample in samples)
+    for stage, key, markers in STAGES:
+        listed = top[folders[key]] or set()
+        for sample in samples:
+            if markers is None:
+                done = sample in listed
+            else:
+                names = inner.get(os.path.join(folders[key], sample)) or set()
+                done = all(marker.format(sample) in names for marker in markers)
+            per_sample[sample][stage] = done
+
+    gems = dict((sample, set()) for sample in samples)
+    for name in top[folders["GEMs"]] or ():
+        if name.endswith(".xml") and gem_sample(name, sample_set):
+            gems[gem_sample(name, sample_set)].add(name[:-4])
+    for folder in gem_dirs:
+        gems[os.path.basename(folder)].update(name[:-4] for name in inner[folder] or () if name.endswith(".xml"))
+    reports = top[folders["memote"]] or set()
+    communities = top[folders["SMETANA"]] or set()
+    for sample in samples:
+        per_sample[sample]["GEMs"] = len(gems[sample])
+        per_sample[sample]["memote"] = len(gems[sample] & reports)
+        per_sample[sample]["smetana"] = "{}_detailed.tsv".format(sample) in communities
+
+    stages = []
+    for stage, _, _ in STAGES:
+        stages.append({"stage": stage, "done": sum(per_sample[sample][stage] for sample in samples), "total": len(samples)})
+    total_gems = sum(len(models) for models in gems.values())
+    stages.append({"stage": "GEMs", "done": sum(1 for sample in samples if gems[sample]), "total": len(samples), "models": total_gems})
+    stages.append({"stage": "memote", "done": sum(per_sample[sample]["memote"] for sample in samples), "total": total_gems, "unit": "models"})
+    stages.append({"stage": "smetana", "done": sum(per_sample[sample]["smetana"] for sample in samples), "total": len(samples)})
+
+    listings.save(set([data] + stage_folders + nested + gem_dirs))
+    return {"root": os.path.abspath(args.root), "time": time.time(), "samples": len(samples), "stages": stages,
+            "per_sample": per_sample, "scan_seconds": round(time.time() - start, 3), "folders_listed": listings.listed}
+
+def write_text(report, args, output):
+    output.write("Raw data: {} samples were identified in the dataset folder\n".format(report["samples"]))
+    for stage in report["stages"]:
+        percent = 100.0 * stage["done"] / stage["total"] if stage["total"] else 0.0
+        unit = stage.get("unit", "samples")
+        extra = ", {} models".format(stage["models"]) if "models" in stage else ""
+        output.write("{:<14}{:>7} / {:<7}{} {:5.1f}%{}\n".format(stage["stage"], stage["done"], stage["total"], unit, percent, extra))
+    if args.samples:
+        names = [stage["stage"] for stage in report["stages"]]
+        output.write("\nsample\t" + "\t".join(names) + "\n")
+        for sample, stages in sorted(report["per_sample"].items()):
+            output.write(sample + "\t" + "\t".join(str(int(stages[name])) for name in names) + "\n")
+    sys.stderr.write("Checked in {:.2f} s, {} folders listed, the others unchanged since the last check\n".format(
+        report["scan_seconds"], report["folders_listed"]))
+
+def main(args):
+    folders = read_folders(args.config)
+    while True:
+        report = status(args, folders)
+        if args.json:
+            if not args.samples:
+                del report["per_sample"]
+            json.dump(report, sys.stdout, sort_keys=True)
+            sys.stdout.write("\n")
+        else:
+            if args.watch:
+                # Clears the terminal before each refresh
+                sys.stdout.write("\033[2J\033[H" + time.strftime("%Y-%m-%d %H:%M:%S") + "\n")
+            write_text(report, args, sys.stdout)
+        sys.stdout.flush()
+        if not args.watch:
+            return 0
+        try:
+            time.sleep(args.watch)
+        except KeyboardInterrupt:
+            return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", nargs='?', default=".", help="Project root folder, default=.")
+    parser.add_argument("--config", default="config.yaml", help="config.yaml with the folder names, default=config.yaml")
+    parser.add_argument("--samples", action="store_true", help="Also report the stages done by each sample")
+    parser.add_argument("--json", action="store_true", help="Print a JSON document instead of text, one per refresh with --watch")
+    parser.add_argument("--watch", default=0, type=float, help="Check again every WATCH seconds until interrupted, default=0 (off)")
+    parser.add_argument("--threads", default=16, type=int, help="Number of folders listed concurrently, default=16")
+    args = parser.parse_args()
+
+    try:
+        sys.exit(main(args))
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+"""
+Manages job specific scratch directories.
+allocate: creates a unique directory SCRATCH/FOLDER/ID.XXXX for one job, optionally waiting (or failing fast) while the
+          scratch space used by metaGEM jobs exceeds a byte budget, and prints its path.
+release:  removes an allocated directory, meant to be called from a shell EXIT trap so it runs on success and failure.
+persist:  creates or reuses the directory SCRATCH/FOLDER/ID.persistent, which survives failed and killed jobs so a
+          resubmitted job can resume from its intermediate files, and prints its path. Release it once the job succeeds.
+report:   lists scratch directories with their size and whether the job that created them is still running,
+          flagging leaked directories and leftovers from rules that did not clean up, and optionally removes them.
+"""
+from __future__ import print_function
+import sys
+import os
+import json
+import time
+import shutil
+import socket
+import getpass
+import errno
+import argparse
+import tempfile
+import subprocess
+
+MARKER = ".metagem_scratch"
+POLL_SECONDS = 30
+
+def tree_size(path):
+    # lstat sizes, so symlinked (staged) inputs do not count towards scratch usage
+    total = 0
+    for folder, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.lstat(os.path.join(folder, name)).st_size
+            except OSError:
+                continue
+    return total
+
+def scratch_dirs(scratch):
+    # Job directories live one level below each folder in the scratch root, e.g. SCRATCH/assemblies/SAMPLE.XXXX
+    for folder in sorted(os.listdir(scratch)):
+        folder_path = os.path.join(scratch, folder)
+        if not os.path.isdir(folder_path) or os.path.islink(folder_path):
+            continue
+        for name in sorted(os.listdir(folder_path)):
+            path = os.path.join(folder_path, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                yield path
+
+def read_marker(path):
+    try:
+        with open(os.path.join(path, MARKER)) as marker:
+            return json.load(marker)
+    except (IOError, OSError, ValueError):
+        return None
+
+def managed_usage(scratch):
+    return sum(tree_size(path) for path in scratch_dirs(scratch) if read_marker(path) is not None)
+
+def allocate(args):
+    folder = os.path.join(args.scratch, args.folder)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    budget = int(args.budget_gb * 1024**3)
+    deadline = time.time() + args.wait_minutes * 60
+    while budget > 0:
+        usage = managed_usage(args.scratch)
+        if usage < budget:
+            break
+        if time.time() >= deadline:
+            sys.stderr.write("Scratch budget exceeded: {:.1f} GB used of {:.1f} GB in {}\n".format(
+                usage / 1024.0**3, args.budget_gb, args.scratch))
+            return 1
+        sys.stderr.write("Scratch budget exceeded ({:.1f} GB used), waiting ... \n".format(usage / 1024.0**3))
+        time.sleep(POLL_SECONDS)
+
+    path = tempfile.mkdtemp(prefix=args.id + ".", dir=folder)
+    with open(os.path.join(path, MARKER), "w") as marker:
+        json.dump({"id": args.id,
+                   "host": socket.gethostname(),
+                   "pid": args.pid,
+                   "job": os.environ.get("SLURM_JOB_ID"),
+                   "user": getpass.getuser(),
+                   "started": time.time()}, marker)
+    print(path)
+    return 0
+
+def persist(args):
+    path = os.path.join(args.scratch, args.folder, args.id + ".persistent")
+    if read_marker(path) is not None:
+        sys.stderr.write("Resuming from persistent scratch directory {}\n".format(path))
+    else:
+        if not os.path.exists(path):
+            os.makedirs(path)
+        with open(os.path.join(path, MARKER), "w") as marker:
+            json.dump({"id": args.id,
+                       "host": socket.gethostname(),
+                       "persistent": True,
+                       "user": getpass.getuser(),
+                       "started": time.time()}, marker)
+    print(path)
+    return 0
+
+def release(args):
+    keep = args.keep_failed.lower() in ("true", "yes", "1") and args.status != 0
+    if keep:
+        sys.stderr.write("Job failed with status {}, keeping scratch directory {} for inspection\n".format(args.status, args.directory))
+        return 0
+    if read_marker(args.directory) is None:
+        # Only ever remove directories created by allocate
+        return 0
+    shutil.rmtree(args.directory, ignore_errors=True)
+    return 0
+
+def running_jobs():
+    # Also runs under the python 2 metawrap environment, hence no subprocess.DEVNULL
+    try:
+        with open(os.devnull, "w") as devnull:
+            output = subprocess.check_output(["squeue", "-h", "-o", "%A", "-u", getpass.getuser()], stderr=devnull)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return set(output.decode().split())
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as error:
+        return error.errno == errno.EPERM
+    return True
+
+def status(marker, jobs, host):
+    if marker is None:
+        return "unmanaged"
+    if marker.get("persistent"):
+        return "persistent"
+    if marker.get("job") and jobs is not None:
+        return "running" if marker["job"] in jobs else "leaked"
+    if marker.get("host") == host and marker.get("pid"):
+        return "running" if pid_alive(marker["pid"]) else "leaked"
+    return "unknown"
+
+def report(args):
+    jobs = running_jobs()
+    host = socket.gethostname()
+    totals = {}
+    removed = 0
+    print("status\tsize_gb\tage_hours\tdirectory")
+    for path in scratch_dirs(args.scratch):
+        marker = read_marker(path)
+        state = status(marker, jobs, host)
+        size = tree_size(path)
+        age = (time.time() - (marker["started"] if marker else os.path.getmtime(path))) / 3600.0
+        totals[state] = totals.get(state, 0) + size
+        print("{}\t{:.2f}\t{:.1f}\t{}".format(state, size / 1024.0**3, age, path))
+        if args.clean and state in args.clean.split(","):
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+
+    sys.stderr.write("\n")
+    for state in sorted(totals):
+        sys.stderr.write("Total {}: {:.2f} GB\n".format(state, totals[state] / 1024.0**3))
+    if args.clean:
+        sys.stderr.write("Removed {} directories\n".format(removed))
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command")
+
+    allocate_parser = subparsers.add_parser("allocate", help="Create a unique scratch directory and print its path")
+    allocate_parser.add_argument("scratch", help="Scratch root, i.e. config.yaml path:scratch")
+    allocate_parser.add_argument("folder", help="Rule specific subfolder of the scratch root")
+    allocate_parser.add_argument("id", help="Sample, bin, or GEM ID used as directory name prefix")
+    allocate_parser.add_argument("--pid", default=os.getppid(), type=int, help="PID of the job shell, default=parent process")
+    allocate_parser.add_argument("--budget_gb", default=0, type=float, help="Maximum scratch usage by metaGEM jobs, default=0 (unlimited)")
+    allocate_parser.add_argument("--wait_minutes", default=0, type=float, help="Time to wait for the budget to free up before failing, default=0 (fail fast)")
+
+    persist_parser = subparsers.add_parser("persist", help="Create or reuse a scratch directory that is kept until released")
+    persist_parser.add_argument("scratch", help="Scratch root, i.e. config.yaml path:scratch")
+    persist_parser.add_argument("folder", help="Rule specific subfolder of the scratch root")
+    persist_parser.add_argument("id", help="Sample ID used as directory name")
+
+    release_parser = subparsers.add_parser("release", help="Remove a scratch directory created by allocate or persist")
+    release_parser.add_argument("directory")
+    release_parser.add_argument("--status", default=0, type=int, help="Exit status of the job")
+    release_parser.add_argument("--keep_failed", default="false", help="Keep the directory when the job failed, default=false")
+
+    report_parser = subparsers.add_parser("report", help="Report scratch usage and leaked directories")
+    report_parser.add_argument("scratch", help="Scratch root, i.e. config.yaml path:scratch")
+    report_parser.add_argument("--clean", default=None, help="Comma separated states to remove, e.g. leaked,unmanaged")
+
+    args = parser.parse_args()
+    commands = {"allocate": allocate, "persist": persist, "release": release, "report": report}
+    if args.command not in commands:
+        parser.print_help()
+        sys.exit(1)
+    sys.exit(commands[args.command](args))
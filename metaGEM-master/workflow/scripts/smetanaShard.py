@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""
+Runs SMETANA on a sample's GEMs as independent shards (one per medium, and optionally one per sub-community),
+then merges the shard results back into a single PREFIX_detailed.tsv file.
+Shards run concurrently in a pool of SMETANA processes, and finished shards are kept in the shard directory
+so they can be produced by separate cluster jobs or reused when an interrupted run is resubmitted.
+Each shard is stored with a fingerprint of its GEMs (file names, sizes, and mtimes), the rows of its medium in the
+media database, and run settings, and is only reused while the fingerprint matches, so shards of GEMs that were since
+added, removed, or rebuilt, or of media that were since edited, are run again.
+"""
+from __future__ import print_function
+import sys
+import os
+import glob
+import shutil
+import hashlib
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+def split_community(models, community_size):
+    # Sub-community sharding changes the community context of the simulation, so it is off by default
+    if community_size <= 0 or community_size >= len(models):
+        return [models]
+    return [models[i:i + community_size] for i in range(0, len(models), community_size)]
+
+def shard_path(shard_directory, sample, medium, chunk, nchunks):
+    if nchunks == 1:
+        name = "{}_{}_detailed.tsv".format(sample, medium)
+    else:
+        name = "{}_{}_c{}of{}_detailed.tsv".format(sample, medium, chunk + 1, nchunks)
+    return os.path.join(shard_directory, name)
+
+def plan_shards(models, sample, media, community_size, shard_directory):
+    chunks = split_community(models, community_size)
+    shards = []
+    for medium in media:
+        for chunk, chunk_models in enumerate(chunks):
+            shards.append((medium, chunk_models, shard_path(shard_directory, sample, medium, chunk, len(chunks))))
+    return shards
+
+def read_media(path):
+    # Rows of each medium in the media database, keyed by the medium ID in the first column
+    media = {}
+    with open(path) as mediadb:
+        for line in mediadb:
+            medium = line.split("\t", 1)[0]
+            media.setdefault(medium, []).append(line.rstrip("\r\n"))
+    return media
+
+def fingerprint(medium, models, media, args):
+    digest = hashlib.sha1("{}\t{}\t{}\n".format(medium, args.flavor, args.solver).encode())
+    for row in media.get(medium, []):
+        digest.update((row + "\n").encode())
+    for model in models:
+        stat = os.stat(model)
+        digest.update("{}\t{}\t{}\n".format(os.path.basename(model), stat.st_size, stat.st_mtime_ns).encode())
+    return digest.hexdigest()
+
+def fingerprint_path(destination):
+    return destination + ".fingerprint"
+
+def is_current(shard, media, args):
+    medium, models, destination = shard
+    try:
+        with open(fingerprint_path(destination)) as stored:
+            return os.path.exists(destination) and stored.read().strip() == fingerprint(medium, models, media, args)
+    except IOError:
+        return False
+
+def run_shard(shard, media, args):
+    medium, models, destination = shard
+    # The fingerprint is written once the shard is in place, so a shard without one is never reused
+    if os.path.exists(fingerprint_path(destination)):
+        os.remove(fingerprint_path(destination))
+    # Write into a private temporary folder first so that partially written shards are never picked up by the merge
+    workdir = tempfile.mkdtemp(prefix=".tmp_", dir=os.path.dirname(destination))
+    prefix = os.path.join(workdir, "shard")
+    command = ["smetana", "-o", prefix, "--flavor", args.flavor,
+               "--mediadb", args.mediadb, "-m", medium,
+               "--detailed", "--solver", args.solver, "-v"] + models
+    sys.stderr.write("Running SMETANA shard {} ({} models) ... \n".format(os.path.basename(destination), len(models)))
+    try:
+        code = subprocess.call(command)
+        if code == 0 and os.path.exists(prefix + "_detailed.tsv"):
+            os.replace(prefix + "_detailed.tsv", destination)
+            with open(fingerprint_path(destination) + ".tmp", "w") as stored:
+                stored.write(fingerprint(medium, models, media, args) + "\n")
+            os.replace(fingerprint_path(destination) + ".tmp", fingerprint_path(destination))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return destination, code
+
+def merge_shards(shards, output):
+    header = None
+    tmp_output = output + ".tmp"
+    with open(tmp_output, "w") as merged:
+        for medium, models, path in shards:
+            with open(path) as shard:
+                first = shard.readline()
+                if not first:
+                    continue
+                if header is None:
+                    header = first
+                    merged.write(header)
+                shutil.copyfileobj(shard, merged)
+    os.replace(tmp_output, output)
+
+def main(args):
+    sample = args.sample or os.path.basename(os.path.normpath(args.gem_directory))
+    models = sorted(glob.glob(os.path.join(args.gem_directory, "*.xml")))
+    media = [medium for medium in args.media.split(",") if medium]
+    if not models:
+        sys.stderr.write("No GEMs (*.xml) found in {}\n".format(args.gem_directory))
+        return 1
+
+    if not os.path.exists(args.shard_directory):
+        os.makedirs(args.shard_directory)
+    shards = plan_shards(models, sample, media, args.community_size, args.shard_directory)
+    media_rows = read_media(args.mediadb)
+    unknown = [medium for medium in media if medium not in media_rows]
+    if unknown:
+        sys.stderr.write("Media not found in {}: {}\n".format(args.mediadb, ", ".join(unknown)))
+        return 1
+    pending = [shard for shard in shards if not is_current(shard, media_rows, args)]
+    stale = [os.path.basename(shard[2]) for shard in pending if os.path.exists(shard[2])]
+    if stale:
+        sys.stderr.write("GEMs, media, or settings changed since these shards were run, running them again: {}\n".format(", ".join(stale)))
+    sys.stderr.write("Sample {}: {} shards planned, {} already finished, running {} with {} processes\n".format(
+        sample, len(shards), len(shards) - len(pending), len(pending), args.processes))
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=args.processes) as pool:
+        for destination, code in pool.map(lambda shard: run_shard(shard, media_rows, args), pending):
+            if code != 0 or not os.path.exists(destination):
+                failed.append(os.path.basename(destination))
+    if failed:
+        sys.stderr.write("\nSMETANA failed for shards: {}\n\n".format(", ".join(failed)))
+        return 1
+
+    if args.output_prefix:
+        merge_shards(shards, args.output_prefix + "_detailed.tsv")
+        sys.stderr.write("\nMerged {} shards into {}_detailed.tsv\n\n".format(len(shards), args.output_prefix))
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("gem_directory", help="Sample folder containing GEM .xml files")
+    parser.add_argument("output_prefix", nargs='?', default=None, help="Merged output is written to OUTPUT_PREFIX_detailed.tsv, omit to only run shards")
+    parser.add_argument("--shard_directory", required=True, help="Directory where per-shard results are kept")
+    parser.add_argument("--mediadb", required=True, help="Media database file")
+    parser.add_argument("--media", required=True, help="Comma separated list of media IDs")
+    parser.add_argument("--solver", default="CPLEX")
+    parser.add_argument("--flavor", default="fbc2")
+    parser.add_argument("--sample", default=None, help="Sample ID used to name shards, default=name of GEM directory")
+    parser.add_argument("--processes", default=1, type=int, help="Number of SMETANA processes to run concurrently, default=1")
+    parser.add_argument("--community_size", default=0, type=int, help="Split each sample into sub-communities of at most this many GEMs, default=0 (no split)")
+    args = parser.parse_args()
+
+    sys.exit(main(args))
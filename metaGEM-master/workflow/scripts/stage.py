@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""
+Stages rule input files or folders into a job's working directory using a configurable policy:
+symlink, hardlink, copy, stream (copy while checksumming, then verify the copy), or auto.
+The auto policy copies files up to --copy_max_mb when they live on a network/parallel filesystem and the destination
+is node-local, and symlinks everything else, so large read files are no longer duplicated just to be read once.
+Staged paths are recorded in DEST/.staged and removed again with --cleanup, e.g. from a shell EXIT trap.
+"""
+from __future__ import print_function
+import sys
+import os
+import shutil
+import hashlib
+import argparse
+
+POLICIES = ["auto", "symlink", "hardlink", "copy", "stream"]
+NETWORK_FS = {"nfs", "nfs4", "lustre", "gpfs", "beegfs", "cifs", "smbfs", "smb3", "panfs", "ceph",
+              "glusterfs", "fuse.glusterfs", "fuse.sshfs", "fuse.cephfs", "wekafs", "orangefs", "pvfs2"}
+MANIFEST = ".staged"
+CHUNK = 16 * 1024 * 1024
+HASH = getattr(hashlib, "blake2b", hashlib.md5)
+
+def mounts():
+    try:
+        with open("/proc/mounts") as mount_table:
+            return [(line.split()[1], line.split()[2]) for line in mount_table if len(line.split()) > 2]
+    except (IOError, OSError):
+        return []
+
+def fs_type(path, mount_table):
+    # Longest mount point that prefixes the resolved path
+    path = os.path.realpath(path)
+    best, best_type = "", "unknown"
+    for mount_point, mount_type in mount_table:
+        if (path == mount_point or path.startswith(mount_point.rstrip("/") + "/")) and len(mount_point) > len(best):
+            best, best_type = mount_point, mount_type
+    return best_type
+
+def size_of(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(folder, name)) for folder, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path)
+
+def choose_policy(source, destination_dir, copy_max, mount_table):
+    source_remote = fs_type(source, mount_table) in NETWORK_FS
+    destination_remote = fs_type(destination_dir, mount_table) in NETWORK_FS
+    if source_remote and not destination_remote and size_of(source) <= copy_max:
+        return "copy"
+    return "symlink"
+
+def stream_copy(source, destination):
+    source_hash = HASH()
+    with open(source, "rb") as source_file, open(destination, "wb") as destination_file:
+        for chunk in iter(lambda: source_file.read(CHUNK), b""):
+            source_hash.update(chunk)
+            destination_file.write(chunk)
+    destination_hash = HASH()
+    with open(destination, "rb") as destination_file:
+        for chunk in iter(lambda: destination_file.read(CHUNK), b""):
+            destination_hash.update(chunk)
+    if source_hash.digest() != destination_hash.digest():
+        os.remove(destination)
+        raise IOError("Checksum mismatch while staging {}".format(source))
+
+def copy_tree(source, destination, copy_function):
+    # shutil.copytree has no copy_function argument on python 2, which the metawrap environment still uses
+    for folder, _, names in os.walk(source):
+        target = os.path.join(destination, os.path.relpath(folder, source))
+        if not os.path.exists(target):
+            os.makedirs(target)
+        for name in names:
+            copy_function(os.path.join(folder, name), os.path.join(target, name))
+
+def stage(source, destination, policy):
+    source = os.path.abspath(source)
+    if policy == "symlink":
+        os.symlink(source, destination)
+    elif policy == "hardlink":
+        try:
+            if os.path.isdir(source):
+                copy_tree(source, destination, os.link)
+            else:
+                os.link(source, destination)
+        except OSError:
+            # Hardlinks do not work across filesystems, fall back to a symlink
+            if os.path.lexists(destination):
+                remove(destination)
+            os.symlink(source, destination)
+            policy = "symlink"
+    elif policy == "stream":
+        if os.path.isdir(source):
+            copy_tree(source, destination, stream_copy)
+        else:
+            stream_copy(source, destination)
+    else:
+        if os.path.isdir(source):
+            copy_tree(source, destination, shutil.copyfile)
+        else:
+            shutil.copyfile(source, destination)
+    return policy
+
+def remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+def cleanup(destination_dir):
+    manifest = os.path.join(destination_dir, MANIFEST)
+    if not os.path.exists(manifest):
+        return 0
+    removed = 0
+    with open(manifest) as staged:
+        for line in staged:
+            path = os.path.join(destination_dir, line.rstrip("\n"))
+            if os.path.lexists(path):
+                remove(path)
+                removed += 1
+    os.remove(manifest)
+    sys.stderr.write("Removed {} staged inputs from {}\n".format(removed, destination_dir))
+    return 0
+
+def main(args):
+    if args.cleanup:
+        return cleanup(args.destination)
+
+    if not os.path.exists(args.destination):
+        os.makedirs(args.destination)
+    copy_max = args.copy_max_mb * 1024 * 1024
+    mount_table = mounts()
+    with open(os.path.join(args.destination, MANIFEST), "a") as manifest:
+        for source in args.sources:
+            name = os.path.basename(os.path.normpath(source))
+            destination = os.path.join(args.destination, name)
+            if os.path.lexists(destination):
+                remove(destination)
+            policy = args.policy
+            if policy == "auto":
+                policy = choose_policy(source, args.destination, copy_max, mount_table)
+            policy = stage(source, destination, policy)
+            manifest.write(name + "\n")
+            sys.stderr.write("Staged {} into {} ({})\n".format(source, args.destination, policy))
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("destination", help="Directory to stage inputs into, usually the job's scratch directory")
+    parser.add_argument("sources", nargs='*', help="Input files or folders to stage")
+    parser.add_argument("--policy", default="auto", choices=POLICIES, help="default=auto")
+    parser.add_argument("--copy_max_mb", default=2048, type=int, help="Largest input copied by the auto policy, default=2048")
+    parser.add_argument("--cleanup", action="store_true", help="Remove everything previously staged into DESTINATION")
+    args = parser.parse_args()
+
+    sys.exit(main(args))
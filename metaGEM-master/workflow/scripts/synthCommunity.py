@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+"""
+Generates a synthetic metagenomics project for offline testing and benchmarking, without the network access needed
+by the downloadToy rule. Random reference genomes are spread over the samples at log-normal abundances, and each
+sample gets simulated paired-end reads in dataset/SAMPLE/ at a set mean genome coverage (--no_reads skips the reads).
+Fake tool outputs are written in the project layout read by the python scripts:
+    qfiltered/SAMPLE/SAMPLE.json                        fastp report
+    assemblies/SAMPLE/contigs.fasta.gz                  contigs cut from the genomes present in the sample
+    kallisto/FOCAL/SAMPLE/abundance.tsv                 kallisto quantification of each sample against the first
+                                                        --focal assemblies, for kallisto2concoct.py
+    concoct/SAMPLE/SAMPLE.concoct-bins/bin.N.fa         one bin per genome present, with some misplaced contigs
+    concoct/SAMPLE/SAMPLE.checkm.tsv                    CheckM qa table of those bins, for binFilter.py
+    refined_bins/SAMPLE/SAMPLE.concoct.stats            metaWRAP CheckM .stats file, for binDB.py
+    reassembled_bins/SAMPLE/reassembled_bins/bin.N.fa   for collectBins.py and binDB.py
+    SMETANA/SAMPLE_detailed.tsv                         SMETANA interactions between the bins, for interactionStats.py
+The true abundance of every genome in every sample is written to synthetic_truth.tsv.
+"""
+from __future__ import print_function
+import sys
+import os
+import gzip
+import json
+import argparse
+
+import numpy as np
+
+BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+COMPLEMENT = np.zeros(256, dtype=np.uint8)
+for base, complement in zip(b"ACGTN", b"TGCAN"):
+    COMPLEMENT[base] = complement
+READ_BATCH = 100000
+MEDIA = ("M1", "M2", "M3")
+
+def sample_names(count):
+    width = max(4, len(str(count)))
+    return ["S{:0{}d}".format(index + 1, width) for index in range(count)]
+
+def makedirs(path):
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+def write_fasta(path, records, line_width=80):
+    with (gzip.open(path, "wb", compresslevel=1) if path.endswith(".gz") else open(path, "wb")) as fasta:
+        for name, sequence in records:
+            data = sequence.tobytes()
+            lines = b"\n".join(data[start:start + line_width] for start in range(0, len(data), line_width))
+            fasta.write(b">" + name.encode() + b"\n" + lines + b"\n")
+
+def make_genomes(rng, count, length):
+    genomes = []
+    for index in range(count):
+        # Genomes differ in size and GC content, like real community members
+        size = int(length * rng.uniform(0.5, 1.5))
+        gc = rng.uniform(0.3, 0.7)
+        probabilities = [(1 - gc) / 2, gc / 2, gc / 2, (1 - gc) / 2]
+        genomes.append(("genome_{}".format(index + 1), BASES[rng.choice(4, size=size, p=probabilities)]))
+    return genomes
+
+def make_profiles(rng, samples, genomes, presence, sigma):
+    # Relative abundance of each genome in each sample, zero for absent genomes
+    profiles = np.zeros((len(samples), len(genomes)))
+    for row in range(len(samples)):
+        present = rng.random(len(genomes)) < presence
+        if not present.any():
+            present[rng.integers(len(genomes))] = True
+        weights = rng.lognormal(0, sigma, size=len(genomes)) * present
+        profiles[row] = weights / weights.sum()
+    return profiles
+
+def cut_contigs(rng, sample, genome_name, genome, min_length, max_length):
+    contigs = []
+    start = 0
+    while start < len(genome):
+        end = min(len(genome), start + int(rng.integers(min_length, max_length + 1)))
+        if end - start >= min_length:
+            contigs.append(("{}_{}_{}_{}".format(sample, genome_name, start + 1, end), genome[start:end]))
+        start = end
+    return contigs
+
+def simulate_reads(rng, path_r1, path_r2, genomes, coverages, args):
+    quality = b"I" * args.read_length
+    pairs = 0
+    with gzip.open(path_r1, "wb", compresslevel=1) as r1, gzip.open(path_r2, "wb", compresslevel=1) as r2:
+        for (name, genome), coverage in zip(genomes, coverages):
+            total = int(coverage * len(genome) / (2 * args.read_length))
+            for batch in range(0, total, READ_BATCH):
+                count = min(READ_BATCH, total - batch)
+                inserts = np.clip(rng.normal(args.insert_size, args.insert_size / 10, count).astype(int), args.read_length, len(genome))
+                starts = rng.integers(0, len(genome) - inserts + 1)
+                offsets = np.arange(args.read_length)
+                forward = genome[starts[:, None] + offsets]
+                reverse = COMPLEMENT[genome[(starts + inserts - 1)[:, None] - offsets]]
+                for reads in (forward, reverse):
+                    errors = rng.random(reads.shape) < args.error_rate
+                    reads[errors] = BASES[rng.integers(0, 4, errors.sum())]
+                for index in range(count):
+                    header = "@{}_{}_{}".format(name, batch + index, starts[index]).encode()
+                    r1.write(header + b"/1\n" + forward[index].tobytes() + b"\n+\n" + quality + b"\n")
+                    r2.write(header + b"/2\n" + reverse[index].tobytes() + b"\n+\n" + quality + b"\n")
+            pairs += total
+    return pairs
+
+def fastp_report(rng, pairs, read_length):
+    # Same layout as the fastp json files parsed by the qfilterVis rule, before_filtering first
+    def summary(reads, bases):
+        q20, q30 = rng.uniform(0.95, 0.99), rng.uniform(0.85, 0.95)
+        return {"total_reads": reads, "total_bases": bases, "q20_bases": int(bases * q20), "q30_bases": int(bases * q30),
+                "q20_rate": round(q20, 6), "q30_rate": round(q30, 6), "read1_mean_length": read_length,
+                "read2_mean_length": read_length, "gc_content": round(rng.uniform(0.4, 0.6), 6)}
+    kept = int(2 * pairs * rng.uniform(0.9, 0.99))
+    return {"summary": {"fastp_version": "0.20.1", "sequencing": "paired end ({} cycles + {} cycles)".format(read_length, read_length),
+                        "before_filtering": summary(2 * pairs, 2 * pairs * read_length),
+                        "after_filtering": summary(kept, kept * read_length)},
+            "filtering_result": {"passed_filter_reads": kept, "low_quality_reads": 2 * pairs - kept}}
+
+def write_kallisto(rng, path, contigs, coverage_of):
+    # est_counts are set so that kallisto2concoct.py recovers the true coverage, 200 * est_counts / length
+    lengths = np.array([len(sequence) for _, sequence in contigs])
+    coverage = np.array([coverage_of[name] for name, _ in contigs])
+    counts = rng.poisson(coverage * lengths / 200.0).astype(float)
+    effective = np.maximum(lengths - 150, 1)
+    rates = counts / effective
+    tpm = rates / rates.sum() * 1e6 if rates.sum() else rates
+    with open(path, "w") as table:
+        table.write("target_id\tlength\teff_length\test_counts\ttpm\n")
+        for (name, _), length, eff, count, value in zip(contigs, lengths, effective, counts, tpm):
+            table.write("{}\t{}\t{}\t{:.1f}\t{:.6f}\n".format(name, length, eff, count, value))
+
+def n50(lengths):
+    lengths = sorted(lengths, reverse=True)
+    half = sum(lengths) / 2.0
+    running = 0
+    for length in lengths:
+        running += length
+        if running >= half:
+            return length
+    return 0
+
+def write_bins(rng, root, sample, contigs, genome_of, args):
+    # One bin per genome, with a few contigs moved to the wrong bin to give the bins some contamination
+    names = sorted(set(genome_of.values()))
+    bins = dict((name, []) for name in names)
+    for contig in contigs:
+        target = genome_of[contig[0]]
+        if len(names) > 1 and rng.random() < args.misbinned:
+            target = names[rng.integers(len(names))]
+        bins[target].append(contig)
+
+    concoct = os.path.join(root, "concoct", sample, sample + ".concoct-bins")
+    reassembled = os.path.join(root, "reassembled_bins", sample, "reassembled_bins")
+    refined = os.path.join(root, "refined_bins", sample)
+    for folder in (concoct, reassembled, refined):
+        makedirs(folder)
+    checkm = ["Bin Id\tMarker lineage\t# genomes\t# markers\tCompleteness\tContamination\tStrain heterogeneity"]
+    stats = ["bin\tcompleteness\tcontamination\tGC\tlineage\tN50\tsize\tbinner"]
+    bin_names = []
+    for number, name in enumerate(names):
+        if not bins[name]:
+            continue
+        bin_name = "bin.{}".format(number)
+        path = os.path.join(concoct, bin_name + ".fa")
+        write_fasta(path, bins[name])
+        os.link(path, os.path.join(reassembled, bin_name + ".fa"))
+        sequence = np.concatenate([contig for _, contig in bins[name]])
+        completeness = rng.uniform(30, 100)
+        contamination = rng.exponential(4)
+        gc = 100.0 * np.isin(sequence, BASES[1:3]).mean()
+        checkm.append("{}\tk__Bacteria (UID203)\t5449\t104\t{:.2f}\t{:.2f}\t0.00".format(bin_name, completeness, contamination))
+        stats.append("{}\t{:.2f}\t{:.2f}\t{:.1f}\tBacteria\t{}\t{}\tconcoct".format(
+            bin_name, completeness, contamination, gc, n50([len(contig) for _, contig in bins[name]]), len(sequence)))
+        bin_names.append(bin_name)
+    with open(os.path.join(root, "concoct", sample, sample + ".checkm.tsv"), "w") as table:
+        table.write("\n".join(checkm) + "\n")
+    for path in (os.path.join(refined, sample + ".concoct.stats"), os.path.join(root, "reassembled_bins", sample, "reassembled_bins.stats")):
+        with open(path, "w") as table:
+            table.write("\n".join(stats) + "\n")
+    return bin_names
+
+def write_smetana(rng, path, sample, bins, args):
+    with open(path, "w") as table:
+        table.write("community\tmedium\treceiver\tdonor\tcompound\tscs\tmus\tmps\tsmetana\n")
+        if len(bins) < 2:
+            return
+        for medium in MEDIA:
+            for _ in range(args.interactions):
+                receiver, donor = rng.choice(len(bins), size=2, replace=False)
+                table.write("{}\t{}\t{}_{}\t{}_{}\tM_cpd{:05d}_e\t{:.3f}\t{:.3f}\t{}\t{:.6f}\n".format(
+                    sample, medium, sample, bins[receiver], sample, bins[donor], rng.integers(100),
+                    rng.random(), rng.random(), int(rng.integers(0, 2)), rng.random()))
+
+def generate(args):
+    rng = np.random.default_rng(args.seed)
+    root = args.output_directory
+    samples = sample_names(args.samples)
+    genomes = make_genomes(rng, args.genomes, args.genome_length)
+    profiles = make_profiles(rng, samples, genomes, args.presence, args.sigma)
+
+    makedirs(os.path.join(root, "genomes"))
+    for name, sequence in genomes:
+        write_fasta(os.path.join(root, "genomes", name + ".fa"), [(name, sequence)])
+    with open(os.path.join(root, "synthetic_truth.tsv"), "w") as truth:
+        truth.write("sample\tgenome\trelative_abundance\tcoverage\n")
+        for row, sample in enumerate(samples):
+            for column, (name, _) in enumerate(genomes):
+                if profiles[row, column] > 0:
+                    # Mean coverage over the genomes present in the sample equals --depth
+                    coverage = args.depth * profiles[row, column] * np.count_nonzero(profiles[row])
+                    truth.write("{}\t{}\t{:.6f}\t{:.3f}\n".format(sample, name, profiles[row, column], coverage))
+
+    genome_index = dict((name, column) for column, (name, _) in enumerate(genomes))
+    coverages = args.depth * profiles * np.count_nonzero(profiles, axis=1)[:, None]
+    focal_contigs = {}
+    for row, sample in enumerate(samples):
+        present = [genomes[column] for column in np.flatnonzero(profiles[row])]
+        contigs = []
+        genome_of = {}
+        for name, sequence in present:
+            for contig in cut_contigs(rng, sample, name, sequence, args.min_contig, args.max_contig):
+                contigs.append(contig)
+                genome_of[contig[0]] = name
+        makedirs(os.path.join(root, "assemblies", sample))
+        write_fasta(os.path.join(root, "assemblies", sample, "contigs.fasta.gz"), contigs)
+        if row < args.focal:
+            focal_contigs[sample] = (contigs, dict((contig, genome_index[name]) for contig, name in genome_of.items()))
+
+        if args.reads:
+            makedirs(os.path.join(root, "dataset", sample))
+            pairs = simulate_reads(rng, os.path.join(root, "dataset", sample, sample + "_R1.fastq.gz"),
+                                   os.path.join(root, "dataset", sample, sample + "_R2.fastq.gz"),
+                                   present, [coverages[row, genome_index[name]] for name, _ in present], args)
+        else:
+            pairs = int(sum(coverages[row, genome_index[name]] * len(sequence) for name, sequence in present) / (2 * args.read_length))
+        makedirs(os.path.join(root, "qfiltered", sample))
+        with open(os.path.join(root, "qfiltered", sample, sample + ".json"), "w") as report:
+            json.dump(fastp_report(rng, pairs, args.read_length), report, indent=1)
+
+        bins = write_bins(rng, root, sample, contigs, genome_of, args)
+        makedirs(os.path.join(root, "SMETANA"))
+        write_smetana(rng, os.path.join(root, "SMETANA", sample + "_detailed.tsv"), sample, bins, args)
+
+    # Every sample is quantified against each focal assembly, as by crossMapParallel
+    for focal, (contigs, contig_genomes) in sorted(focal_contigs.items()):
+        for row, sample in enumerate(samples):
+            folder = os.path.join(root, "kallisto", focal, sample)
+            makedirs(folder)
+            write_kallisto(rng, os.path.join(folder, "abundance.tsv"), contigs,
+                           dict((contig, coverages[row, column]) for contig, column in contig_genomes.items()))
+    sys.stderr.write("Generated {} samples from {} genomes in {}\n".format(len(samples), len(genomes), root))
+    return 0
+
+def parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output_directory", help="Project root to write, e.g. a copy of the metaGEM folder layout")
+    parser.add_argument("--samples", default=3, type=int, help="default=3")
+    parser.add_argument("--genomes", default=20, type=int, help="Genomes in the community, default=20")
+    parser.add_argument("--genome_length", default=100000, type=int, help="Mean genome length, default=100000")
+    parser.add_argument("--presence", default=0.4, type=float, help="Probability that a genome is present in a sample, default=0.4")
+    parser.add_argument("--sigma", default=1.0, type=float, help="Log-normal abundance spread, default=1.0")
+    parser.add_argument("--depth", default=10.0, type=float, help="Mean coverage of the genomes present in a sample, default=10")
+    parser.add_argument("--no_reads", dest="reads", action="store_false", help="Only write the fake tool outputs, no FASTQ files")
+    parser.add_argument("--read_length", default=150, type=int, help="default=150")
+    parser.add_argument("--insert_size", default=400, type=int, help="Mean fragment length, default=400")
+    parser.add_argument("--error_rate", default=0.005, type=float, help="Per base substitution rate, default=0.005")
+    parser.add_argument("--min_contig", default=1000, type=int, help="default=1000")
+    parser.add_argument("--max_contig", default=20000, type=int, help="default=20000")
+    parser.add_argument("--misbinned", default=0.02, type=float, help="Fraction of contigs put into a wrong bin, default=0.02")
+    parser.add_argument("--focal", default=1, type=int, help="Assemblies every sample is quantified against with kallisto, default=1")
+    parser.add_argument("--interactions", default=50, type=int, help="SMETANA interactions per sample and medium, default=50")
+    parser.add_argument("--seed", default=420, type=int, help="default=420")
+    return parser
+
+if __name__ == "__main__":
+    sys.exit(generate(parser().parse_args()))